@@ -69,10 +69,12 @@ class BaseESN(object):
         self._leakingRate = newLeakingRate
 
     def setInputScaling(self, newInputScaling):
-        inputScaling = B.ones(self.n_input) * self._inputScaling
-        self._expandedInputScaling = B.vstack((B.array(1.0), inputScaling.reshape(-1, 1))).flatten()
-        self._WInput = self._WInput * ( self._expandedInputScaling / self._inputScaling )
-        self._inputScaling = newInputScaling
+        inputScaling = B.ones(self.n_input) * newInputScaling
+        expandedInputScaling = B.vstack((B.array(1.0), inputScaling.reshape(-1, 1))).flatten()
+        #only the input columns are scaled, the bias column of _WInput stays unchanged
+        self._WInput = self._WInput * ( expandedInputScaling / self._expandedInputScaling )
+        self._expandedInputScaling = expandedInputScaling
+        self._inputScaling = inputScaling
 
     def setFeedbackScaling(self, newFeedbackScaling):
         self._WFeedback = self._WFeedback * ( newFeedbackScaling / self._feedbackScaling)
@@ -82,6 +84,29 @@ class BaseESN(object):
     def resetState(self):
         self._x = B.zeros_like(self._x)
 
+    """
+        Returns a copy of the current state, which can be restored later by setState.
+    """
+    def getState(self):
+        return self._x.copy()
+
+    """
+        Restores a state previously returned by getState (the state is copied, so that it can be restored multiple times).
+    """
+    def setState(self, state):
+        if state.shape != self._x.shape:
+            raise ValueError("The shape of the state {0} does not match the shape of the ESN's state {1}.".format(state.shape, self._x.shape))
+        self._x = state.copy()
+
+    """
+        Creates n copies of the state (or the current state if it is None) as the columns of a (n_reservoir, n) matrix,
+        e.g. to run several scenarios from the same state with stepBatch without repeating the transient phase.
+    """
+    def forkState(self, n, state=None):
+        if state is None:
+            state = self._x
+        return B.zeros((self.n_reservoir, n)) + state.reshape((self.n_reservoir, 1))
+
     def propagate(self, inputData, outputData=None, transientTime=0, verbose=0, x=None, steps="auto", previousOutputData=None):
         if x is None:
             x = self._x
@@ -128,10 +153,7 @@ class BaseESN(object):
                         X[:,t-transientTime] = B.vstack((B.array(self._outputBias), x))[:,0]
                     if outputData is None:
                         #calculate the prediction using the trained model
-                        if (self._solver in ["sklearn_auto", "sklearn_lsqr", "sklearn_sag", "sklearn_svd"]):
-                            previousOutputData = self._ridgeSolver.predict(B.vstack((B.array(self._outputBias), self._x)).T)
-                        else:
-                            previousOutputData = B.dot(self._WOut, B.vstack((B.array(self._outputBias), self._x)))
+                        previousOutputData = self._readout(B.vstack((B.array(self._outputBias), self._x)))
                         if t >= transientTime:
                             Y[t-transientTime, :] = previousOutputData
                     else:
@@ -147,10 +169,7 @@ class BaseESN(object):
                         X[:,t-transientTime] = B.vstack((B.array(self._outputBias), self._outputInputScaling*u, x))[:,0]
                     if outputData is None:
                         #calculate the prediction using the trained model
-                        if (self._solver in ["sklearn_auto", "sklearn_lsqr", "sklearn_sag", "sklearn_svd"]):
-                            previousOutputData = self._ridgeSolver.predict(B.vstack((B.array(self._outputBias), self._outputInputScaling*u, self._x)).T)
-                        else:
-                            previousOutputData = B.dot(self._WOut, B.vstack((B.array(self._outputBias), self._outputInputScaling*u, self._x)))
+                        previousOutputData = self._readout(B.vstack((B.array(self._outputBias), self._outputInputScaling*u, self._x)))
                         Y[t, :] = previousOutputData
                     else:
                         previousOutputData = outputData[t]
@@ -166,6 +185,69 @@ class BaseESN(object):
         else:
             return X
 
+    """
+        Calculates the (not yet activated) output for the extended states `X` with the shape (1+n_input+n_reservoir, n).
+        The sklearn object is only used if the readout could not be extracted as a matrix (e.g. for non-linear solvers).
+    """
+    def _readout(self, X):
+        if self._WOut is not None:
+            return B.dot(self._WOut, X)
+        else:
+            return self._ridgeSolver.predict(X.T).reshape((-1, self.n_output)).T
+
+    """
+        Calculates the (not yet activated) output of a batch of reservoirs, whose states are the columns of x
+        (shape (n_reservoir, batch)). u is the unscaled input with the shape (n_input, batch) or (n_input, 1) if it is shared.
+    """
+    def _readoutBatch(self, x, u=None):
+        if self._WOut is None:
+            ones = B.ones((1, x.shape[1]))
+            if u is None or self.n_input == 0:
+                return self._readout(B.vstack((ones*self._outputBias, x)))
+            else:
+                return self._readout(B.vstack((ones*self._outputBias, ones*self._outputInputScaling*u, x)))
+
+        y = B.dot(self._WOut[:, 1+self.n_input:], x) + self._WOut[:, :1]*self._outputBias
+        if u is not None and self.n_input != 0:
+            y += B.dot(self._WOut[:, 1:1+self.n_input], self._outputInputScaling*u)
+        return y
+
+    """
+        Extracts the output weights of a fitted linear sklearn solver, so that it can be evaluated by a simple dot product.
+        The intercept is merged into the weight of the output bias. Returns None if this is not possible.
+    """
+    def _extractLinearReadout(self):
+        if not hasattr(self._ridgeSolver, "coef_") or self._outputBias == 0:
+            return None
+
+        WOut = B.array(np.array(self._ridgeSolver.coef_, dtype=float).reshape((self.n_output, -1)))
+        intercept = np.array(self._ridgeSolver.intercept_, dtype=float).reshape(-1)
+        WOut[:, 0] += intercept / self._outputBias
+
+        return WOut
+
+    """
+        Solves the output weights from the accumulated sums X X^T and Y X^T, so that the whole design matrix
+        never has to be stored. Only the `pinv` and `lsqr` solvers can be used here.
+    """
+    def _solveFromGramSums(self, XXT, YXT):
+        if self._solver == "pinv":
+            #Y pinv(X) = Y X^T pinv(X X^T)
+            return B.dot(YXT, B.pinv(XXT))
+        elif self._solver == "lsqr":
+            return B.dot(YXT, B.inv(XXT + self._regressionParameters[0]*B.identity(XXT.shape[0])))
+        else:
+            raise ValueError("Fitting from accumulated sums is only supported for the solvers `pinv` and `lsqr`, but `{0}` was chosen.".format(self._solver))
+
+    """
+        Calculates the training RMSE of the output weights WOut from the accumulated sums X X^T, Y X^T and the sum of Y^2.
+        As Y is the target of the readout, the error is in the space of the out_inverse_activation, not of the output.
+    """
+    @staticmethod
+    def _inverseActivationErrorFromGramSums(WOut, XXT, YXT, sumYSquared, count):
+        squaredError = sumYSquared - 2.0*np.sum(WOut * YXT) + np.sum(B.dot(WOut, XXT) * WOut)
+        return B.sqrt(max(squaredError, 0.0) / count)
+
     """
         Generates a random rotation matrix, used in the SORM initilization (see http://ftp.math.uni-rostock.de/pub/preprint/2012/pre12_01.pdf)
     """
@@ -332,6 +414,199 @@ class BaseESN(object):
 
                 return np.empty((0, 1))
 
+    """
+        Updates the inner states of a batch of independent reservoirs in place. The states are the columns of x
+        (shape (n_reservoir, batch)), inputData and outputData have the shapes (n_input, batch) and (n_output, batch)
+        (or a single column which is shared by all reservoirs). If noise is None, it is drawn like in update.
+    """
+    def updateBatch(self, x, inputData=None, outputData=None, noise=None):
+        transmission = B.dot(self._W, x)
+        if self.n_input != 0:
+            transmission += B.dot(self._WInput[:, 1:], inputData) + self._WInput[:, :1]*self._bias
+        if self._WFeedback is not None:
+            transmission += B.dot(self._WFeedback[:, 1:], outputData) + self._WFeedback[:, :1]*self._outputBias
+
+        if noise is None:
+            noise = (B.rand(1, x.shape[1])-0.5)*self._noiseLevel
+
+        x *= (1.0-self._leakingRate)
+        x += self._leakingRate*self._activation(transmission + noise)
+
+        return x
+
+    """
+        Propagates variants of this reservoir, which share its topology but differ in their spectral radius, input scaling and
+        leaking rate (as if they had been derived by setSpectralRadius, setInputScaling and setLeakingRate), together as the
+        columns of one state matrix. spectralRadii, inputScalings and leakingRates contain the values of the variants, x their
+        initial states (shape (n_reservoir, nVariants)), which are updated in place.
+        Returns the design matrices of the variants with the shape (nVariants, 1+n_input+n_reservoir, length-transientTime).
+    """
+    def propagateVariants(self, inputData, x, spectralRadii, inputScalings, leakingRates, transientTime=0):
+        if self._WFeedback is not None:
+            raise ValueError("Variants can only be propagated together for ESNs without feedback.")
+
+        nVariants = x.shape[1]
+        inputLength = len(inputData)
+
+        #per column scale factors of the recurrent and the input term relative to this reservoir
+        recurrentScaling = (B.array(np.array(spectralRadii, dtype=float)) / self._spectralRadius).reshape((1, nVariants))
+        inputScaling = (B.ones((nVariants, self.n_input)) * B.array(np.array(inputScalings, dtype=float)).reshape((nVariants, -1))).T / \
+                       B.array(self._inputScaling).reshape((-1, 1))
+        leakingRate = B.array(np.array(leakingRates, dtype=float)).reshape((1, nVariants))
+
+        X = B.empty((nVariants, 1 + self.n_input + self.n_reservoir, inputLength - transientTime))
+        X[:, 0] = self._outputBias
+
+        for t in range(inputLength):
+            u = B.array(inputData[t]).reshape((self.n_input, 1))
+
+            transmission = recurrentScaling*B.dot(self._W, x) + B.dot(self._WInput[:, 1:], inputScaling*u) + self._WInput[:, :1]*self._bias
+            noise = (B.rand(1, nVariants)-0.5)*self._noiseLevel
+
+            x *= (1.0-leakingRate)
+            x += leakingRate*self._activation(transmission + noise)
+
+            if t >= transientTime:
+                X[:, 1:1+self.n_input, t-transientTime] = (self._outputInputScaling*u).T
+                X[:, 1+self.n_input:, t-transientTime] = x.T
+
+        return X
+
+    """
+        Splits the sequences into buckets of at most bucketSize sequences with similar lengths. Inside of a bucket, the
+        sequences are sorted by their length (descending), so that the still active sequences are always the first columns.
+    """
+    @staticmethod
+    def _lengthBuckets(lengths, bucketSize=None):
+        order = np.argsort(-lengths, kind="stable")
+        if bucketSize is None:
+            bucketSize = len(lengths)
+        return [order[i:i+bucketSize] for i in range(0, len(lengths), bucketSize)]
+
+    """
+        Pads the sequences with the indices `indices` into one array with the shape (time, dimension, len(indices)).
+    """
+    @staticmethod
+    def _padSequences(sequences, indices, lengths, dimension):
+        padded = B.zeros((lengths[indices[0]], dimension, len(indices)))
+        for j, i in enumerate(indices):
+            padded[:lengths[i], :, j] = B.array(sequences[i]).reshape((lengths[i], dimension))
+        return padded
+
+    """
+        Propagates a batch of independent sequences (a list of arrays with the shapes (length_i, n_input) or a 3-D array),
+        which all start from the zero state, together as the columns of one state matrix. The sequences are sorted by their
+        length, so that only the still active sequences are updated in each step; they are processed in buckets of at most
+        bucketSize sequences with similar lengths to keep the padded inputs small.
+        Returns one pooled feature vector of the extended states [outputBias; u; x] per sequence (shape (nFeatures, nSequences)):
+            mean: the mean of the extended states after the transientTime (nFeatures = 1+n_input+n_reservoir)
+            last: the extended state of the last step (nFeatures = 1+n_input+n_reservoir)
+            meanlast: both of them stacked (nFeatures = 2*(1+n_input+n_reservoir))
+    """
+    def propagateBatch(self, inputData, transientTime=0, pooling="mean", bucketSize=None):
+        if pooling not in ["mean", "last", "meanlast"]:
+            raise ValueError("pooling must be one of the following values: mean, last, meanlast")
+
+        nSequences = len(inputData)
+        lengths = np.array([len(sequence) for sequence in inputData])
+        if np.min(lengths) <= transientTime:
+            raise ValueError("All sequences have to be longer than the transient time ({0}).".format(transientTime))
+
+        nFeatures = 1 + self.n_input + self.n_reservoir
+        result = B.empty(((2 if pooling == "meanlast" else 1)*nFeatures, nSequences))
+
+        for bucket in self._lengthBuckets(lengths, bucketSize):
+            bucketLengths = lengths[bucket]
+            nBucket = len(bucket)
+
+            #pad the inputs into the shape (time, n_input, nBucket)
+            U = self._padSequences(inputData, bucket, lengths, self.n_input)
+
+            x = B.zeros((self.n_reservoir, nBucket))
+            sumX = B.zeros((nFeatures, nBucket))
+
+            nActive = nBucket
+            for t in range(bucketLengths[0]):
+                while bucketLengths[nActive-1] <= t:
+                    nActive -= 1
+
+                activeX = x[:, :nActive]
+                self.updateBatch(activeX, U[t, :, :nActive])
+
+                if t >= transientTime and pooling != "last":
+                    sumX[1:1+self.n_input, :nActive] += self._outputInputScaling*U[t, :, :nActive]
+                    sumX[1+self.n_input:, :nActive] += activeX
+
+            features = []
+            if pooling != "last":
+                sumX[0] = self._outputBias*(bucketLengths - transientTime)
+                features.append(sumX / (bucketLengths - transientTime))
+            if pooling != "mean":
+                #the states of finished sequences have not been updated anymore, so x contains the last states
+                lastU = U[bucketLengths-1, :, np.arange(nBucket)].T
+                features.append(B.vstack((B.ones((1, nBucket))*self._outputBias, self._outputInputScaling*lastU, x)))
+
+            result[:, bucket] = B.vstack(features)
+
+        return result
+
+    """
+        Propagates a batch of independent sequences with different lengths (lists of arrays with the shapes (length_i, n_input)
+        and (length_i, n_output) for teacher forcing of the feedback), which all start from the zero state, together as the columns
+        of one state matrix. Sequences which have already ended are neither updated nor written into the design matrix.
+        Returns the design matrix of all sequences (in their original order) after removing the transientTime steps of each sequence,
+        i.e. with the shape (1+n_input+n_reservoir, sum(length_i - transientTime)). The state of the last sequence is stored in _x.
+    """
+    def propagateRagged(self, inputData, outputData=None, transientTime=0, bucketSize=None):
+        sequences = inputData if inputData is not None else outputData
+        if self._WFeedback is not None and outputData is None:
+            raise ValueError("The outputData is required for the teacher forcing of an ESN with feedback.")
+
+        nSequences = len(sequences)
+        lengths = np.array([len(sequence) for sequence in sequences])
+        if np.min(lengths) <= transientTime:
+            raise ValueError("All sequences have to be longer than the transient time ({0}).".format(transientTime))
+
+        #first column of each sequence inside of the design matrix
+        offsets = np.concatenate(([0], np.cumsum(lengths - transientTime)))
+        X = B.empty((1 + self.n_input + self.n_reservoir, offsets[-1]))
+
+        for bucket in self._lengthBuckets(lengths, bucketSize):
+            bucketLengths = lengths[bucket]
+            nBucket = len(bucket)
+
+            U = self._padSequences(inputData, bucket, lengths, self.n_input) if self.n_input != 0 else None
+            O = self._padSequences(outputData, bucket, lengths, self.n_output) if self._WFeedback is not None else None
+
+            x = B.zeros((self.n_reservoir, nBucket))
+            u = None
+            y = None
+
+            nActive = nBucket
+            for t in range(bucketLengths[0]):
+                while bucketLengths[nActive-1] <= t:
+                    nActive -= 1
+
+                activeX = x[:, :nActive]
+                if U is not None:
+                    u = U[t, :, :nActive]
+                if O is not None:
+                    #the feedback is the output of the previous step
+                    y = O[t-1, :, :nActive] if t > 0 else B.zeros((self.n_output, nActive))
+                self.updateBatch(activeX, u, y)
+
+                if t >= transientTime:
+                    columns = offsets[bucket[:nActive]] + t - transientTime
+                    X[0, columns] = self._outputBias
+                    if u is not None:
+                        X[1:1+self.n_input, columns] = self._outputInputScaling*u
+                    X[1+self.n_input:, columns] = activeX
+
+            if nSequences-1 in bucket:
+                self._x = x[:, list(bucket).index(nSequences-1)].reshape((self.n_reservoir, 1)).copy()
+
+        return X
+
     def calculateTransientTime(self, inputs, outputs, epsilon, proximityLength = None):
         # inputs: input of reserovoir
         # outputs: output of reservoir
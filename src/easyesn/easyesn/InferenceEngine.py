@@ -0,0 +1,206 @@
+"""
+    In-process engine to serve many independent streams with one trained PredictionESN.
+"""
+
+import numpy as np
+import threading
+import queue
+import time
+from concurrent.futures import Future
+
+from . import backend as B
+
+
+class InferenceEngine(object):
+    """
+    Serves many independent streams (e.g. sensors) with one trained PredictionESN. Every stream has its own reservoir state;
+    the states are stored as the columns of one contiguous (n_reservoir, n_streams) array. Incoming ticks are collected into
+    micro-batches, which are advanced by one matrix product (see PredictionESN.stepBatch).
+
+    Ticks are either processed synchronously by `step` or submitted asynchronously by `submit`/`submitAsync`. The latter are
+    batched by a background thread, which waits at most `maxWait` seconds for up to `maxBatchSize` ticks.
+    """
+
+    def __init__(self, esn, maxBatchSize=256, maxWait=0.001, initialCapacity=64):
+        self._esn = esn
+        self.maxBatchSize = maxBatchSize
+        self.maxWait = maxWait
+
+        self._streamIndices = {}
+        self._states = B.zeros((esn.n_reservoir, initialCapacity))
+        self._lock = threading.Lock()
+
+        self._queue = queue.Queue()
+        self._thread = None
+        self._running = False
+
+    @property
+    def nStreams(self):
+        return len(self._streamIndices)
+
+    """
+        Adds a new stream, which starts from the state `state` (or the zero state).
+    """
+    def addStream(self, streamID, state=None):
+        with self._lock:
+            self._addStream(streamID, state)
+
+    def _addStream(self, streamID, state=None):
+        if streamID in self._streamIndices:
+            raise ValueError("The stream {0} does already exist.".format(streamID))
+
+        index = len(self._streamIndices)
+        if index == self._states.shape[1]:
+            #double the capacity
+            self._states = B.concatenate((self._states, B.zeros(self._states.shape)), axis=1)
+
+        self._streamIndices[streamID] = index
+        self._states[:, index] = 0.0 if state is None else B.array(state).reshape(-1)
+
+    """
+        Removes the stream `streamID`. The state of the last stream is moved into its column, so that the states stay contiguous.
+    """
+    def removeStream(self, streamID):
+        with self._lock:
+            index = self._streamIndices.pop(streamID)
+            lastIndex = len(self._streamIndices)
+            if index != lastIndex:
+                lastStreamID = next(k for k, v in self._streamIndices.items() if v == lastIndex)
+                self._states[:, index] = self._states[:, lastIndex]
+                self._streamIndices[lastStreamID] = index
+
+    def resetStream(self, streamID, state=None):
+        with self._lock:
+            self._states[:, self._streamIndices[streamID]] = 0.0 if state is None else B.array(state).reshape(-1)
+
+    def getState(self, streamID):
+        with self._lock:
+            return self._states[:, self._streamIndices[streamID]].copy()
+
+    """
+        Advances the streams `streamIDs` by one tick each and returns their outputs (shape (len(streamIDs), n_output)).
+        Unknown streams are added with the zero state. Every stream may only occur once per call.
+        inputData has the shape (len(streamIDs), n_input) and previousOutputData (for ESNs with feedback) (len(streamIDs), n_output).
+    """
+    def step(self, streamIDs, inputData, previousOutputData=None):
+        with self._lock:
+            for streamID in streamIDs:
+                if streamID not in self._streamIndices:
+                    self._addStream(streamID)
+            indices = [self._streamIndices[streamID] for streamID in streamIDs]
+            if len(set(indices)) != len(indices):
+                raise ValueError("Every stream may only occur once per batch.")
+
+            states = self._states[:, indices]
+            Y, states = self._esn.stepBatch(inputData, states, previousOutputData)
+            self._states[:, indices] = states
+
+        return Y
+
+    """
+        Submits one tick of the stream `streamID` and returns a concurrent.futures.Future of its output (shape (n_output,)).
+        The engine is started automatically.
+    """
+    def submit(self, streamID, inputData, previousOutputData=None):
+        if not self._running:
+            self.start()
+
+        future = Future()
+        self._queue.put((streamID, inputData, previousOutputData, future))
+        return future
+
+    """
+        Submits one tick like `submit`, but returns an awaitable for asyncio based servers.
+    """
+    def submitAsync(self, streamID, inputData, previousOutputData=None):
+        import asyncio
+        return asyncio.wrap_future(self.submit(streamID, inputData, previousOutputData))
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+        self._thread.start()
+
+    """
+        Stops the background thread after all submitted ticks have been processed.
+    """
+    def close(self):
+        if not self._running:
+            return
+        self._queue.put(None)
+        self._thread.join()
+        self._thread = None
+        self._running = False
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    """
+        Collects the next micro-batch: waits for the first tick, then for at most `maxWait` seconds or until `maxBatchSize`
+        ticks are available. Returns the ticks and whether the engine has been closed.
+    """
+    def _collectBatch(self, pending):
+        batch = pending
+        closed = False
+
+        if len(batch) == 0:
+            item = self._queue.get()
+            if item is None:
+                return batch, True
+            batch.append(item)
+
+        deadline = time.perf_counter() + self.maxWait
+        while len(batch) < self.maxBatchSize:
+            timeout = deadline - time.perf_counter()
+            try:
+                item = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                closed = True
+                break
+            batch.append(item)
+
+        return batch, closed
+
+    def _serve(self):
+        pending = []
+        closed = False
+
+        while not closed or len(pending) > 0:
+            if closed:
+                batch = pending
+            else:
+                batch, closed = self._collectBatch(pending)
+            if len(batch) == 0:
+                continue
+
+            #every stream is only advanced once per batch; further ticks of the same stream are kept for the next batch
+            current, pending, seen = [], [], set()
+            for item in batch:
+                if item[0] in seen:
+                    pending.append(item)
+                else:
+                    seen.add(item[0])
+                    current.append(item)
+
+            try:
+                streamIDs = [item[0] for item in current]
+                inputData = np.array([np.reshape(item[1], -1) for item in current]) if self._esn.n_input != 0 else None
+                previousOutputData = None
+                if self._esn._WFeedback is not None:
+                    previousOutputData = np.array([np.zeros(self._esn.n_output) if item[2] is None else np.reshape(item[2], -1) for item in current])
+
+                Y = self.step(streamIDs, inputData, previousOutputData)
+
+                for i, item in enumerate(current):
+                    item[3].set_result(Y[i])
+            except Exception as ex:
+                for item in current:
+                    item[3].set_exception(ex)
@@ -1,14 +1,20 @@
 import numpy as np
+import scipy.sparse
 
 class OneHotEncoder(object):
-    def __init__(self, classes=None, handleUnknown="error"):
+    def __init__(self, classes=None, handleUnknown="error", sparse=False):
+        if handleUnknown not in ["error", "ignore"]:
+            raise ValueError("handleUnknown must be one of the following values: error, ignore")
+
         self.classes = classes
         self.handleUnknown = handleUnknown
+        self.sparse = sparse
 
     def fit(self, data):
+        data = np.asarray(data)
         if len(data.shape) == 1:
             data = data.reshape(-1, 1)
-        
+
         if data.shape[1] != 1:
             raise ValueError("The data has to one dimensional, so it either has to have the shape (*) or (*, 1).")
 
@@ -16,14 +22,65 @@ class OneHotEncoder(object):
             #get unique classes
             self.classes = np.unique(data)
 
+    """
+        Returns the indices of the classes of data. Unknown classes either raise an error or get the index -1 (handleUnknown="ignore").
+    """
+    def transformLabels(self, data):
+        if self.classes is None:
+            raise ValueError("The OneHotEncoder has not been fitted yet.")
+
+        data = np.asarray(data).reshape(-1)
+        classes = np.asarray(self.classes)
+
+        indices = np.searchsorted(classes, data)
+        indices[indices == len(classes)] = 0
+        unknown = classes[indices] != data
+
+        if np.any(unknown):
+            if self.handleUnknown == "error":
+                raise ValueError("The data contains unknown classes: {0}".format(np.unique(data[unknown])))
+            indices[unknown] = -1
+
+        return indices
 
+    """
+        Returns the one hot encoded data, either as a dense array or as a sparse CSR matrix (sparse=True).
+        Unknown classes are encoded as zero rows if handleUnknown is set to "ignore".
+    """
     def transform(self, data):
-        result = np.zeros((len(data), len(self.classes)))
-        for i in range(len(data)):
-            result[i, np.searchsorted(self.classes, data[i])] = 1.0
+        indices = self.transformLabels(data)
+        rows = np.nonzero(indices >= 0)[0]
+        shape = (len(indices), len(self.classes))
 
+        if self.sparse:
+            return scipy.sparse.csr_matrix((np.ones(len(rows)), (rows, indices[rows])), shape=shape)
+
+        result = np.zeros(shape)
+        result[rows, indices[rows]] = 1.0
         return result
 
     def fit_transform(self, data):
         self.fit(data)
-        return self.transform(data)
\ No newline at end of file
+        return self.transform(data)
+
+    """
+        Returns the classes for one hot encoded data (or scores, for which the class with the highest score is chosen)
+        or for the indices of the classes. The index -1 of unknown classes (see transformLabels) cannot be transformed.
+    """
+    def inverse_transform(self, data):
+        if self.classes is None:
+            raise ValueError("The OneHotEncoder has not been fitted yet.")
+
+        if scipy.sparse.issparse(data):
+            indices = np.asarray(data.argmax(axis=1)).reshape(-1)
+        else:
+            data = np.asarray(data)
+            if len(data.shape) == 1 or data.shape[1] == 1:
+                indices = data.reshape(-1).astype(int)
+            else:
+                indices = np.argmax(data, axis=1)
+
+        if np.any(indices < 0):
+            raise ValueError("The data contains the index -1 of unknown classes, which cannot be transformed back.")
+
+        return np.asarray(self.classes)[indices]
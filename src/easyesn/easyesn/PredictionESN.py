@@ -7,6 +7,7 @@ import numpy.random as rnd
 from .BaseESN import BaseESN
 
 from . import backend as B
+from . import helper as hp
 
 from sklearn.linear_model import Ridge
 from sklearn.svm import SVR
@@ -34,6 +35,7 @@ class PredictionESN(BaseESN):
 
         self._solver = solver
         self._regressionParameters = regressionParameters
+        self._WOut = None
 
         self._x = B.zeros((self.n_reservoir, 1))
 
@@ -52,8 +54,27 @@ class PredictionESN(BaseESN):
 
     """
         Fits the ESN so that by applying the inputData the outputData will be produced.
+        Instead of arrays, inputData can also be a collection of sequences (see _fitSequences); outputData has to be None then,
+        and the returned training error is calculated before the out_activation.
+        Sequences with different lengths can be passed as lists of arrays or as packed arrays together with their offsets (see _fitRagged).
     """
-    def fit(self, inputData, outputData, transientTime="AutoReduce", transientTimeCalculationEpsilon = 1e-3, transientTimeCalculationLength = 20, verbose=0):
+    def fit(self, inputData, outputData=None, transientTime="AutoReduce", transientTimeCalculationEpsilon = 1e-3, transientTimeCalculationLength = 20, verbose=0,
+            offsets=None, bucketSize=None):
+        if offsets is not None:
+            if inputData is not None:
+                inputData = hp.unpackSequences(inputData, offsets)
+            outputData = hp.unpackSequences(outputData, offsets)
+
+        #fit on a batch of sequences with different lengths, which are propagated together
+        if outputData is not None and hp.isSequenceCollection(outputData):
+            return self._fitRagged(inputData, outputData, transientTime, transientTimeCalculationEpsilon, transientTimeCalculationLength, bucketSize)
+
+        #fit on a collection of (variable length) sequences without stacking them into one array
+        if hp.isSequenceCollection(inputData):
+            if outputData is not None:
+                raise ValueError("outputData must be None if inputData is a collection of (input, output) sequences.")
+            return self._fitSequences(inputData, transientTime, transientTimeCalculationEpsilon, transientTimeCalculationLength, verbose)
+
         #check the input data
         if self.n_input != 0:
             if len(inputData.shape) == 3 and len(outputData.shape) > 1:
@@ -126,6 +147,19 @@ class PredictionESN(BaseESN):
         for i in range(timeseriesCount):
             Y_target[:, i*partialLength:(i+1)*partialLength] = self.out_inverse_activation(outputData[i]).T[:,transientTime:]
 
+        train_prediction = self._fitReadout(Y_target)
+
+        #calculate the training error now
+        #flatten the outputData
+        outputData = outputData[:, transientTime:, :].reshape(totalLength, -1)
+        training_error = B.sqrt(B.mean((train_prediction - outputData)**2))
+        return training_error
+
+    """
+        Fits the output weights (or the sklearn solver) for the design matrix self._X and the target values Y_target.
+        Returns the training prediction.
+    """
+    def _fitReadout(self, Y_target):
         if (self._solver == "pinv"):
             self._WOut = B.dot(Y_target, B.pinv(self._X))
 
@@ -160,24 +194,153 @@ class PredictionESN(BaseESN):
 
             self._ridgeSolver.fit(self._X.T, Y_target.T)
 
+            #use the weights of the linear model directly, as sklearn's predict is slow for single steps
+            self._WOut = self._extractLinearReadout()
+
             #calculate the training prediction now
             train_prediction = self.out_activation(self._ridgeSolver.predict(self._X.T))
 
         elif (self._solver in ["sklearn_svr", "sklearn_svc"]):
             self._ridgeSolver = SVR(**self._regressionParameters)
+            self._WOut = None
 
             self._ridgeSolver.fit(self._X.T, Y_target.T.ravel())
 
             #calculate the training prediction now
             train_prediction = self.out_activation(self._ridgeSolver.predict(self._X.T))
 
+        return train_prediction
+
+    """
+        Determines the transient time for the sequence (inputData, outputData) if it is set to `Auto` or `AutoReduce`.
+    """
+    def _determineTransientTime(self, inputData, outputData, transientTime, transientTimeCalculationEpsilon, transientTimeCalculationLength):
+        if transientTime == "Auto":
+            transientTime = self.calculateTransientTime(inputData, outputData, transientTimeCalculationEpsilon, transientTimeCalculationLength)
+        if transientTime == "AutoReduce":
+            if (inputData is None and outputData.shape[1] == 1) or (inputData is not None and inputData.shape[1] == 1):
+                transientTime = self.calculateTransientTime(inputData, outputData, transientTimeCalculationEpsilon, transientTimeCalculationLength)
+                transientTime = self.reduceTransientTime(inputData, outputData, transientTime)
+            else:
+                print("Transient time reduction is supported only for 1 dimensional input.")
+                transientTime = 0
+
+        return transientTime
+
+    """
+        Fits the ESN on a batch of sequences with different lengths (lists of arrays with the shapes (length_i, n_input) and
+        (length_i, n_output)). All sequences start from the zero state and are propagated together as the columns of one state
+        matrix (see propagateRagged), in buckets of at most bucketSize sequences with similar lengths.
+        The transient time is determined on the first sequence, if it is set to `Auto` or `AutoReduce`. As the reduction of
+        the transient time assumes that the states start in their equilibrium, `AutoReduce` is treated like `Auto` here.
+    """
+    def _fitRagged(self, inputData, outputData, transientTime="AutoReduce", transientTimeCalculationEpsilon = 1e-3, transientTimeCalculationLength = 20, bucketSize=None):
+        if self.n_input != 0:
+            if inputData is None:
+                raise ValueError("inputData must not be None.")
+            if len(inputData) != len(outputData):
+                raise ValueError("Amount of input and output datasets is not equal - {0} != {1}".format(len(inputData), len(outputData)))
+            inputData = [B.array(sequence).reshape((-1, self.n_input)) for sequence in inputData]
+        elif inputData is not None:
+            raise ValueError("n_input has been set to zero. Therefore, the given inputData will not be used.")
+        outputData = [B.array(sequence).reshape((-1, self.n_output)) for sequence in outputData]
+
+        if inputData is not None:
+            for i in range(len(inputData)):
+                if inputData[i].shape[0] != outputData[i].shape[0]:
+                    raise ValueError("Amount of input and output time steps of sequence {0} is not equal - {1} != {2}".format(i, inputData[i].shape[0], outputData[i].shape[0]))
+
+        self.resetState()
+
+        #every sequence starts from the zero state, so the transient time must not be reduced
+        if transientTime == "AutoReduce":
+            transientTime = "Auto"
+        transientTime = self._determineTransientTime(inputData[0] if inputData is not None else None, outputData[0], transientTime,
+                                                     transientTimeCalculationEpsilon, transientTimeCalculationLength)
+
+        self._X = self.propagateRagged(inputData, outputData, transientTime, bucketSize)
+
+        #define the target values
+        outputData = B.concatenate([sequence[transientTime:] for sequence in outputData], axis=0)
+        Y_target = self.out_inverse_activation(outputData).T
+
+        train_prediction = self._fitReadout(Y_target)
+
         #calculate the training error now
-        #flatten the outputData
-        outputData = outputData[:, transientTime:, :].reshape(totalLength, -1)
         training_error = B.sqrt(B.mean((train_prediction - outputData)**2))
         return training_error
 
 
+    """
+        Fits the ESN on a collection of sequences, which is either the path of a directory containing `<name>_input.npy`
+        and `<name>_output.npy` files or an iterable of (input, output) pairs. The sequences may have different lengths.
+        As for _fitRagged, every sequence starts from the zero state (and `AutoReduce` is treated like `Auto`), so that both
+        give the same output weights. They are propagated one after another (while the next one is loaded in the background) and only the sums X X^T and
+        Y X^T are stored, so that the memory usage does not depend on the amount of data. Only `pinv` and `lsqr` are supported.
+        In contrast to fit on arrays, the returned training error is the RMSE in the space of the out_inverse_activation
+        (i.e. of the readout before the out_activation), as the states are not kept to apply the out_activation afterwards.
+        Both errors are equal for the default (identity) out_activation.
+    """
+    def _fitSequences(self, sequences, transientTime="AutoReduce", transientTimeCalculationEpsilon = 1e-3, transientTimeCalculationLength = 20, verbose=0):
+        if self._solver not in ["pinv", "lsqr"]:
+            raise ValueError("Fitting on a collection of sequences is only supported for the solvers `pinv` and `lsqr`, but `{0}` was chosen.".format(self._solver))
+
+        #every sequence starts from the zero state, so the transient time must not be reduced
+        if transientTime == "AutoReduce":
+            transientTime = "Auto"
+
+        nFeatures = 1 + self.n_input + self.n_reservoir
+        XXT = B.zeros((nFeatures, nFeatures))
+        YXT = B.zeros((self.n_output, nFeatures))
+        sumYSquared = 0.0
+        count = 0
+
+        if (verbose > 0):
+            bar = progressbar.ProgressBar(max_value=progressbar.UnknownLength, redirect_stdout=True, poll_interval=0.0001)
+            bar.update(0)
+
+        for i, (inputData, outputData) in enumerate(hp.openSequenceCollection(sequences)):
+            if self.n_input != 0:
+                if inputData is None:
+                    raise ValueError("The input data of sequence {0} is missing.".format(i))
+                inputData = B.array(inputData).reshape((-1, self.n_input))
+            elif inputData is not None:
+                raise ValueError("n_input has been set to zero. Therefore, the given inputData will not be used.")
+            outputData = B.array(outputData).reshape((-1, self.n_output))
+
+            if inputData is not None and inputData.shape[0] != outputData.shape[0]:
+                raise ValueError("Amount of input and output time steps of sequence {0} is not equal - {1} != {2}".format(i, inputData.shape[0], outputData.shape[0]))
+
+            # Automatic transient time calculations, based on the first sequence
+            transientTime = self._determineTransientTime(inputData, outputData, transientTime, transientTimeCalculationEpsilon, transientTimeCalculationLength)
+
+            if outputData.shape[0] <= transientTime:
+                raise ValueError("Sequence {0} is not longer than the transient time ({1}).".format(i, transientTime))
+
+            self.resetState()
+            X = self.propagate(inputData, outputData, transientTime, verbose-1)
+            Y_target = self.out_inverse_activation(outputData).T[:, transientTime:]
+
+            XXT += B.dot(X, X.T)
+            YXT += B.dot(Y_target, X.T)
+            sumYSquared += float((Y_target**2).sum())
+            count += Y_target.size
+
+            if (verbose > 0):
+                bar.update(i)
+        if (verbose > 0):
+            bar.finish()
+
+        if count == 0:
+            raise ValueError("The collection of sequences is empty.")
+
+        self._WOut = self._solveFromGramSums(XXT, YXT)
+
+        #the training error is calculated in the space of the out_inverse_activation
+        training_error = self._inverseActivationErrorFromGramSums(self._WOut, XXT, YXT, sumYSquared, count)
+        return training_error
+
+
     """
         Use the ESN in the generative mode to generate a signal autonomously.
     """
@@ -235,6 +398,84 @@ class PredictionESN(BaseESN):
         #return the result
         return Y.T
 
+    """
+        Use the ESN in the generative mode to generate a batch of signals at once, e.g. an ensemble forecast from perturbed
+        initial conditions. The trajectories are stored as the columns of one state matrix, so that each step needs only one matrix product.
+
+        initialOutputData: output of the last step before the generation, shape (batch, n_output) or (n_output,)
+        initialStates: reservoir states to start from, shape (batch, n_reservoir) or None to start every trajectory from the current state
+        inputData: shape (n, n_input) if it is shared by all trajectories, or (batch, n, n_input)
+        noise: optional noise realisations with the shape (batch, n) or (batch, n, n_reservoir); the internal noise is used if it is None
+
+        Returns an array with the shape (batch, n, n_output). The current state of the ESN is not modified.
+    """
+    def generateBatch(self, n, initialOutputData, initialStates=None, inputData=None, noise=None, verbose=0):
+        if self._WFeedback is None:
+            raise ValueError("The generative mode requires an ESN with feedback.")
+
+        initialOutputData = B.array(initialOutputData).reshape((-1, self.n_output))
+        if initialStates is None:
+            initialStates = self._x.reshape((1, self.n_reservoir))
+        else:
+            initialStates = B.array(initialStates).reshape((-1, self.n_reservoir))
+
+        batchSize = max(initialOutputData.shape[0], initialStates.shape[0])
+        if initialOutputData.shape[0] not in (1, batchSize) or initialStates.shape[0] not in (1, batchSize):
+            raise ValueError("The batch sizes of initialOutputData ({0}) and initialStates ({1}) do not match.".format(initialOutputData.shape[0], initialStates.shape[0]))
+
+        if self.n_input != 0:
+            if inputData is None:
+                raise ValueError("inputData must not be None.")
+            inputData = B.array(inputData)
+            if len(inputData.shape) == 1:
+                inputData = inputData.reshape((-1, self.n_input))
+            if inputData.shape[-2] < n:
+                raise ValueError("Length of inputData has to be >= n.")
+            if len(inputData.shape) == 3 and inputData.shape[0] != batchSize:
+                raise ValueError("The batch size of inputData ({0}) does not match the batch size ({1}).".format(inputData.shape[0], batchSize))
+
+        if noise is not None:
+            noise = B.array(noise)
+            if noise.shape[0] != batchSize or noise.shape[1] < n:
+                raise ValueError("noise has to have the shape (batch, n) or (batch, n, n_reservoir).")
+
+        #the columns of x and y are the states and outputs of the single trajectories
+        x = B.zeros((self.n_reservoir, batchSize)) + initialStates.T
+        y = B.zeros((self.n_output, batchSize)) + initialOutputData.T
+        u = None
+
+        Y = B.empty((batchSize, n, self.n_output))
+
+        if (verbose > 0):
+            bar = progressbar.ProgressBar(max_value=n, redirect_stdout=True, poll_interval=0.0001)
+            bar.update(0)
+
+        for t in range(n):
+            if self.n_input != 0:
+                if len(inputData.shape) == 3:
+                    u = inputData[:, t].reshape((batchSize, self.n_input)).T
+                else:
+                    u = inputData[t].reshape((self.n_input, 1))
+
+            if noise is None:
+                noise_t = None
+            elif len(noise.shape) == 2:
+                noise_t = noise[:, t].reshape((1, batchSize))
+            else:
+                noise_t = noise[:, t].T
+
+            self.updateBatch(x, u, y, noise_t)
+            y = self._readoutBatch(x, u)
+            Y[:, t, :] = y.T
+
+            if (verbose > 0):
+                bar.update(t)
+
+        if (verbose > 0):
+            bar.finish()
+
+        return Y
+
     """
         Use the ESN in the predictive mode to predict the output signal by using an input signal.
     """
@@ -266,10 +507,7 @@ class PredictionESN(BaseESN):
             X, _ = X
 
         #calculate the prediction using the trained model
-        if (self._solver in ["sklearn_auto", "sklearn_lsqr", "sklearn_sag", "sklearn_svd", "sklearn_svr"]):
-            Y = self._ridgeSolver.predict(X.T).reshape((self.n_output, -1))
-        else:
-            Y = B.dot(self._WOut, X)
+        Y = self._readout(X)
 
         #apply the output activation function
         Y = update_processor(self.out_activation(Y))
@@ -277,6 +515,62 @@ class PredictionESN(BaseESN):
         #return the result
         return Y.T
 
+    """
+        Advances the ESN by a single time step, e.g. for online serving. In contrast to predict, the state is passed explicitly
+        (shape (n_reservoir,) or (n_reservoir, 1)) and updated in place; if it is None, a copy of the current state is used.
+        The internal state of the ESN is not modified. For ESNs with feedback, previousOutputData is the (observed) output of the last step.
+
+        Returns the output of this step (shape (n_output,)) and the new state.
+    """
+    def step(self, inputData, state=None, previousOutputData=None):
+        if state is None:
+            state = self._x.copy()
+        x = state.reshape((self.n_reservoir, 1))
+
+        u = None
+        if self.n_input != 0:
+            if not hasattr(inputData, "reshape"):
+                inputData = B.array(inputData)
+            u = inputData.reshape((self.n_input, 1))
+
+        y = None
+        if self._WFeedback is not None:
+            if previousOutputData is None:
+                y = B.zeros((self.n_output, 1))
+            else:
+                if not hasattr(previousOutputData, "reshape"):
+                    previousOutputData = B.array(previousOutputData)
+                y = previousOutputData.reshape((self.n_output, 1))
+
+        self.updateBatch(x, u, y)
+
+        return self.out_activation(self._readoutBatch(x, u)).reshape(self.n_output), state
+
+    """
+        Advances a batch of independent streams by a single time step. The states of the streams are the columns of
+        states (shape (n_reservoir, batch)) and are updated in place, so that each step needs only one matrix product.
+        inputData has the shape (batch, n_input) and previousOutputData (for ESNs with feedback) the shape (batch, n_output).
+
+        Returns the outputs of this step with the shape (batch, n_output) and the new states.
+    """
+    def stepBatch(self, inputData, states, previousOutputData=None):
+        batchSize = states.shape[1]
+
+        u = None
+        if self.n_input != 0:
+            u = B.array(inputData).reshape((batchSize, self.n_input)).T
+
+        y = None
+        if self._WFeedback is not None:
+            if previousOutputData is None:
+                y = B.zeros((self.n_output, batchSize))
+            else:
+                y = B.array(previousOutputData).reshape((batchSize, self.n_output)).T
+
+        self.updateBatch(states, u, y)
+
+        return self.out_activation(self._readoutBatch(states, u)).T, states
+
     def optimize(self, trainingInput, trainingOutput, validationInput, validationOutput, verbose):
         gridSearch = GridSearchOptimizer()
         gradientOptimizer = GradientOptimizer()
@@ -31,6 +31,7 @@ class RegressionESN(BaseESN):
 
         self._solver = solver
         self._regressionParameters = regressionParameters
+        self._WOut = None
 
         """
             allowed values for the solver:
@@ -123,11 +124,15 @@ class RegressionESN(BaseESN):
 
             self._ridgeSolver.fit(self._X.T, Y_target.T)
 
+            #use the weights of the linear model directly, as sklearn's predict is slow for single steps
+            self._WOut = self._extractLinearReadout()
+
             #calculate the training prediction now
             train_prediction = self.out_activation(self._ridgeSolver.predict(self._X.T))
 
         elif (self._solver in ["sklearn_svr", "sklearn_svc"]):
             self._ridgeSolver = SVR(**self._regressionParameters)
+            self._WOut = None
 
             self._ridgeSolver.fit(self._X.T, Y_target.T.ravel())
 
@@ -162,10 +167,7 @@ class RegressionESN(BaseESN):
 
             X = self.propagate(inputData[n], transientTime)
             #calculate the prediction using the trained model
-            if (self._solver in ["sklearn_auto", "sklearn_lsqr", "sklearn_sag", "sklearn_svd", "sklearn_svr"]):
-                y = self._ridgeSolver.predict(X.T).reshape((self.n_output, -1))
-            else:
-                y = B.dot(self._WOut, X)
+            y = self._readout(X)
 
             Y[n] = np.mean(y, 1)
 
@@ -13,100 +13,19 @@ from sklearn.svm import SVR
 from sklearn.linear_model import LogisticRegression
 import progressbar
 import sys
+import copy
+import uuid
+import os
+import weakref
+import dill
 
-# import dill
+from easyesn import helper as hp
+from easyesn import spatioTemporalWorker
 
-import multiprocess
-from multiprocess import Process, Queue, Manager, Pool, \
-    cpu_count  # we require Pathos version >=0.2.6. Otherwise we will get an "EOFError: Ran out of input" exception
-# import multiprocessing
-import ctypes
-from multiprocessing import process
+from multiprocess import Pool, cpu_count
+from multiprocessing.pool import ThreadPool
 
 
-class PredictionArrayIterator:
-    def __init__(self, array, jobs, width, stride, stesn):
-        self.array = array
-        self.jobs = jobs
-        self._filterWidth = width
-        self._stride = stride
-        self.current = 0
-        self.stesn = stesn
-
-    def __iter__(self):
-        return self
-
-    def __len__(self):
-        return len(self.jobs)
-
-    def next(self):
-        return self.__next__()
-
-    def __next__(self):
-        if self.current >= len(self):
-            raise StopIteration
-        else:
-            try:
-                indices = self.jobs[self.current]
-                y, x = indices
-                self.current += 1
-
-                inData = self.array[:, y - self._filterWidth:y + self._filterWidth + 1,
-                         x - self._filterWidth:x + self._filterWidth + 1][:, ::self._stride, ::self._stride].reshape(
-                    len(self.array), -1)
-
-                state = self.stesn._xs[self.stesn._uniqueIDFromIndices([x - self._filterWidth for x in indices])]
-
-                return inData, indices, state
-            except Exception as e:
-                print(e)
-                import traceback
-                traceback.print_exc()
-                return 0
-
-class FittingArrayIterator:
-    def __init__(self, array, output_array, jobs, width, stride, stesn):
-        self.array = array
-        self.output_array = output_array
-        self.jobs = jobs
-        self._filterWidth = width
-        self._stride = stride
-        self.current = 0
-        self.stesn = stesn
-
-    def __iter__(self):
-        return self
-
-    def __len__(self):
-        return len(self.jobs)
-
-    def next(self):
-        return self.__next__()
-
-    def __next__(self):
-        if self.current >= len(self):
-            raise StopIteration
-        else:
-            try:
-                indices = self.jobs[self.current]
-                y, x = indices
-                self.current += 1
-
-                inData = self.array[:, :, y - self._filterWidth:y + self._filterWidth + 1,
-                         x - self._filterWidth:x + self._filterWidth + 1][:, :, ::self._stride, ::self._stride].reshape(
-                    *self.array.shape[:2], -1)
-
-                outData = self.output_array[:, :, y-self._filterWidth, x-self._filterWidth].reshape(len(self.output_array), -1, 1)
-
-                state = self.stesn._xs[self.stesn._uniqueIDFromIndices([x - self._filterWidth for x in indices])]
-
-                return inData, outData, indices, state
-            except Exception as e:
-                print(e)
-                import traceback
-                traceback.print_exc()
-                return 0
-
 class SpatioTemporalESN(BaseESN):
     def __init__(self, inputShape, n_reservoir,
                  filterSize=1, stride=1, borderMode="mirror", nWorkers="auto",
@@ -115,8 +34,11 @@ class SpatioTemporalESN(BaseESN):
                  out_activation=lambda x: x, out_inverse_activation=lambda x: x,
                  weightGeneration='naive', bias=1.0, outputBias=1.0,
                  outputInputScaling=1.0, inputDensity=1.0, solver='pinv', regressionParameters={}, activation=B.tanh,
-                 activationDerivation=lambda x: 1.0 / B.cosh(x) ** 2):
+                 activationDerivation=lambda x: 1.0 / B.cosh(x) ** 2, engine="pool", tileSize=None, pool=None,
+                 storePath=None, executor=None, nShards=None):
 
+        if not averageOutputWeights in [False, True, "pooled"]:
+            raise ValueError("`averageOutputWeights` must be set to one of the following values: `False`, `True` or `pooled`.")
         self._averageOutputWeights = averageOutputWeights
         if averageOutputWeights and solver != "lsqr":
             raise ValueError(
@@ -130,6 +52,13 @@ class SpatioTemporalESN(BaseESN):
         self._regressionParameters = regressionParameters
         self._solver = solver
 
+        if not engine in ["pool", "vectorized", "tiled"]:
+            raise ValueError("`engine` must be set to one of the following values: `pool`, `vectorized` or `tiled`.")
+        if solver not in ["pinv", "lsqr"]:
+            raise ValueError("The SpatioTemporalESN only supports the solvers `pinv` and `lsqr`.")
+        self._engine = engine
+        self._tileSize = tileSize
+
         n_inputDimensions = len(inputShape)
 
         if filterSize % 2 == 0:
@@ -143,25 +72,31 @@ class SpatioTemporalESN(BaseESN):
         self.n_inputDimensions = n_inputDimensions
         self.inputShape = inputShape
 
+        self._storePath = storePath
         if not self._averageOutputWeights:
-            self._WOuts = B.empty((np.prod(inputShape), 1, self._n_input + n_reservoir + 1))
+            self._WOuts = self._createStore("WOuts", (np.prod(inputShape), 1, self._n_input + n_reservoir + 1))
             self._WOut = None
         else:
             self._WOuts = None
             self._WOut = B.zeros((1, self._n_input + n_reservoir + 1))
-        self._xs = B.empty((np.prod(inputShape), n_reservoir, 1))
+        self._xs = self._createStore("xs", (np.prod(inputShape), n_reservoir, 1))
 
         if nWorkers == "auto":
             self._nWorkers = np.max((cpu_count() - 1, 1))
         else:
             self._nWorkers = nWorkers
 
-        manager = Manager()
-        self.sharedNamespace = manager.Namespace()
-        if hasattr(self, "fitWorkerID") == False or self.parallelWorkerIDs is None:
-            self.parallelWorkerIDs = manager.Queue()
-            for i in range(self._nWorkers):
-                self.parallelWorkerIDs.put((i))
+        #the pool is either created on the first use and owned by the ESN or passed by the caller (and shared with other ESNs)
+        self._pool = pool
+        self._ownsPool = pool is None
+        self._poolSnapshot = None
+        self._poolFinalizer = None
+        self._poolGeneration = 0
+        self._modelID = uuid.uuid4().hex
+        self._threadPool = None
+
+        self._executor = executor
+        self._nShards = nShards
 
         super(SpatioTemporalESN, self).__init__(n_input=self._n_input, n_reservoir=n_reservoir, n_output=1,
                                                 spectralRadius=spectralRadius,
@@ -184,8 +119,100 @@ class SpatioTemporalESN(BaseESN):
                 sklearn_cholesky
                 sklearn_lsqr
                 sklearn_sag
+
+            allowed values for the engine:
+                pool: every pixel is propagated and fitted separately by a process of a multiprocess pool
+                vectorized: the states of all pixels are the columns of one matrix, which is advanced by one matrix
+                            product per time step; the pixels are split into tiles of at most tileSize pixels, which
+                            are processed by nWorkers threads
+                tiled: like vectorized, but the input is not embedded as a whole: every tile reads only its rows and
+                       the halo of filterWidth rows around them from the input (which can be a np.memmap), so that the
+                       memory usage is bounded by the size of the tiles instead of the size of the grid
+
+            If an executor (any concurrent.futures.Executor, e.g. a ProcessPoolExecutor or the executor of a cluster) is
+            passed, fit and predict split the grid into nShards (default: nWorkers) bands of rows. Every band is sent
+            with its halo rows and fitted or predicted independently by the vectorized engine of the executor's worker;
+            the states and output weights of the bands are merged afterwards.
+
+            If storePath is set, the states of the pixels, their output weights and the predictions of the tiled engine
+            are kept in memory mapped .npy files in this directory instead of the RAM. The returned predictions (and
+            generated frames) are views of these files, which are overwritten by the next call of predict (or generate).
+
+            allowed values for averageOutputWeights:
+                False: every pixel has its own output weights
+                True: the output weights of all pixels are fitted separately and averaged
+                pooled: one ridge regression is solved for the sums of X X^T and Y X^T over all pixels, which gives the
+                        shared output weights without solving one regression per pixel
+
+            The processes of the pool engine stay alive between the calls of fit and predict until close is called
+            (or the ESN is used as a context manager); a multiprocess Pool can also be passed as pool.
         """
 
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    """
+        Shuts down the pool of the ESN, if it has been created by the ESN (a pool, which has been passed by the caller,
+        is not closed), and the threads of step.
+    """
+    def close(self):
+        if self._threadPool is not None:
+            self._threadPool.close()
+            self._threadPool.join()
+            self._threadPool = None
+
+        if self._pool is not None and self._ownsPool:
+            self._poolFinalizer.detach()
+            self._poolFinalizer = None
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+            self._poolSnapshot = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_pool"] = None
+        state["_ownsPool"] = True
+        state["_poolSnapshot"] = None
+        state["_poolFinalizer"] = None
+        state["_threadPool"] = None
+        state["_executor"] = None
+        if state.get("_storePath") is not None:
+            #the memory mapped stores are reopened instead of being copied
+            state["_xs"] = None
+            state["_WOuts"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if state.get("_storePath") is not None and state.get("_xs", 0) is None and os.path.exists(os.path.join(self._storePath, "xs.npy")):
+            self._xs = self._openStore("xs")
+            if not self._averageOutputWeights:
+                self._WOuts = self._openStore("WOuts")
+
+    """
+        Creates the (zero initialized) store `name` with the given shape, which is a memory mapped .npy file in storePath
+        or an array if no storePath has been set.
+    """
+    def _createStore(self, name, shape):
+        if self._storePath is None:
+            return B.zeros(shape)
+
+        os.makedirs(self._storePath, exist_ok=True)
+        return np.lib.format.open_memmap(os.path.join(self._storePath, name + ".npy"), mode="w+", dtype=np.float64,
+                                         shape=tuple(int(n) for n in shape))
+
+    def _openStore(self, name):
+        return np.lib.format.open_memmap(os.path.join(self._storePath, name + ".npy"), mode="r+")
+
+    def _flushStores(self):
+        for store in [self._xs, self._WOuts]:
+            if isinstance(store, np.memmap):
+                store.flush()
+
     @staticmethod
     def _isWindows():
         return hasattr(sys, 'getwindowsversion')
@@ -196,27 +223,41 @@ class SpatioTemporalESN(BaseESN):
         else:
             self._x[index] = B.zeros((self.n_reservoir, 1))
 
-    def _embedInputData(self, inputData):
+    """
+        Pads the spatial dimensions of inputData (shape (series, time, *spatialShape)) according to the borderMode.
+        If padFirstAxis is False, the first spatial dimension is not padded (see _embedTile).
+    """
+    def _embedInputData(self, inputData, padFirstAxis=True):
         rank = len(inputData.shape) - 2
+        padding = [(0, 0), (0, 0)] + [(self._filterWidth, self._filterWidth)] * rank
+        if not padFirstAxis:
+            padding[2] = (0, 0)
+
+        if self._borderMode == "padding":
+            return np.pad(inputData, tuple(padding), mode="constant", constant_values=0)
+        else:
+            return np.pad(inputData, tuple(padding), mode=self._padModes[self._borderMode])
+
+    _padModes = {"mirror": "symmetric", "padding": "constant", "edge": "edge", "wrap": "wrap"}
+
+    """
+        Embeds only the rows of the tile and the halo of filterWidth rows around them. The rows of the halo are taken from
+        the input (or the border) exactly like _embedInputData would do for the whole input, but only these rows are read.
+        Returns the embedded rows with the shape (series, time, rows + 2*filterWidth, *paddedShape[1:]).
+    """
+    def _embedTile(self, inputData, tile):
+        rowPixels = int(np.prod(self.inputShape[1:]))
+        firstRow, lastRow = tile.start // rowPixels, tile.stop // rowPixels
+
+        #apply the border mode to the row indices to find the rows of the halo
+        rows = np.pad(np.arange(self.inputShape[0]), self._filterWidth, mode=self._padModes[self._borderMode],
+                      **({"constant_values": -1} if self._borderMode == "padding" else {}))
+        rows = rows[firstRow:lastRow + 2 * self._filterWidth]
+
+        band = np.array(inputData[:, :, np.maximum(rows, 0)])
+        band[:, :, rows < 0] = 0
 
-        if self._borderMode == "mirror":
-            modifiedInputData = np.pad(inputData,
-                                       tuple([(0, 0), (0, 0)] + [(self._filterWidth, self._filterWidth)] * rank),
-                                       mode="symmetric")
-        elif self._borderMode == "padding":
-            modifiedInputData = np.pad(inputData,
-                                       tuple([(0, 0), (0, 0)] + [(self._filterWidth, self._filterWidth)] * rank),
-                                       mode="constant", constant_values=0)
-        elif self._borderMode == "edge":
-            modifiedInputData = np.pad(inputData,
-                                       tuple([(0, 0), (0, 0)] + [(self._filterWidth, self._filterWidth)] * rank),
-                                       mode="edge")
-        elif self._borderMode == "wrap":
-            modifiedInputData = np.pad(inputData,
-                                       tuple([(0, 0), (0, 0)] + [(self._filterWidth, self._filterWidth)] * rank),
-                                       mode="wrap")
-
-        return modifiedInputData
+        return self._embedInputData(band, padFirstAxis=False)
     
     """
         Fits the ESN so that by applying a time series out of inputData the outputData will be produced.
@@ -237,246 +278,636 @@ class SpatioTemporalESN(BaseESN):
             # modify rank again
             rank -= 1
 
-        partialLength = (inputData.shape[1] - transientTime)
-        totalLength = inputData.shape[0] * partialLength
-        timeseriesCount = inputData.shape[0]
+        if self._executor is not None:
+            return self._fitSharded(inputData, outputData, transientTime, verbose)
+        if self._engine in ["vectorized", "tiled"]:
+            return self._fitVectorized(inputData, outputData, transientTime, verbose)
 
-        manager = Manager()
-        fitQueue = manager.Queue()
+        arrays = {"input": self._embedInputData(inputData), "output": outputData, "xs": self._xs}
+        if not self._averageOutputWeights:
+            arrays["WOuts"] = self._WOuts.shape
 
-        modifiedInputData = self._embedInputData(inputData)
+        blocks, shared, arraySpecs = self._createSharedArrays(arrays)
+        try:
+            results = self._runPool(spatioTemporalWorker.fitPixels, arraySpecs,
+                                    {"transientTime": transientTime, "pooled": self._averageOutputWeights == "pooled"}, verbose)
 
-        self.sharedNamespace.transientTime = transientTime
+            self._xs[...] = shared["xs"]
+            if not self._averageOutputWeights:
+                self._WOuts[...] = shared["WOuts"]
+        finally:
+            del shared
+            self._releaseSharedArrays(blocks)
 
-        self.sharedNamespace.partialLength = partialLength
-        self.sharedNamespace.totalLength = totalLength
-        self.sharedNamespace.timeseriesCount = timeseriesCount
+        for _, _, failed in results:
+            for id in failed:
+                print("WARNING: Fit process for pixel {0} did not succeed".format(list(np.unravel_index(id, self.inputShape))), file=sys.stderr)
 
-        jobs = np.stack(np.meshgrid(*[np.arange(x) + self._filterWidth for x in inputData.shape[2:]]),
-                        axis=rank).reshape(-1, rank).tolist()
+        self._finishReadout(self._mergePartialReadouts([partial for _, partial, _ in results]))
 
-        nJobs = len(jobs)
+    """
+        Merges the partial results of the readout of several groups of pixels: the sums of X X^T and Y X^T (pooled) or the
+        sums of the output weights (averaged). The output weights of the single pixels have already been stored.
+    """
+    def _mergePartialReadouts(self, partials):
+        if self._averageOutputWeights == "pooled":
+            return sum([XXT for XXT, _ in partials]), sum([YXT for _, YXT in partials])
+        elif self._averageOutputWeights:
+            return sum(partials)
+        return None
 
-        self.resetState()
+    """
+        Computes the shared output weights from the merged partial results (see _mergePartialReadouts).
+    """
+    def _finishReadout(self, partial):
+        if self._averageOutputWeights == "pooled":
+            self._WOut = self._solveFromGramSums(*partial)
+        elif self._averageOutputWeights:
+            self._WOut = partial / np.prod(self.inputShape)
 
-        iterator = FittingArrayIterator(modifiedInputData, outputData, jobs, self._filterWidth, self._stride, self)
+    """
+        Use the ESN in the predictive mode to predict the output signal by using an input signal.
+        inputData is either one sequence (shape (time, *inputShape)), which continues from the current states of the
+        pixels and updates them, or a batch of independent sequences (shape (series, time, *inputShape)). All sequences
+        of a batch start from the current states, which are not changed, and are propagated together as additional
+        state columns. The prediction has the shape (time-transientTime, *inputShape) or (series, time-transientTime, *inputShape).
+    """
+    def predict(self, inputData, transientTime=0, update_processor=lambda x: x, verbose=0):
+        rank = len(inputData.shape) - 1
 
-        pool = Pool(processes=self._nWorkers, initializer=SpatioTemporalESN._init_fitProcess, initargs=[fitQueue, self])
-        pool.map_async(self._fitProcess, iterator, chunksize=16)
+        if rank != self.n_inputDimensions and rank != self.n_inputDimensions + 1:
+            raise ValueError(
+                "The `inputData` does not have a suitable shape. It has to have {0} spatial dimensions and 1 temporal dimension.".format(
+                    self.n_inputDimensions))
 
-        def _processPoolWorkerResults():
-            nJobsDone = 0
+        batch = rank != self.n_inputDimensions
+        if not batch:
+            inputData = inputData.reshape(1, *inputData.shape)
 
-            if verbose > 0:
-                bar = progressbar.ProgressBar(max_value=nJobs, redirect_stdout=True, poll_interval=0.0001)
-                bar.update(0)
+        if self._executor is not None:
+            predictionOutput = self._predictSharded(inputData, transientTime, verbose, updateStates=not batch)
+        elif self._engine in ["vectorized", "tiled"]:
+            predictionOutput = self._predictVectorized(inputData, transientTime, verbose, updateStates=not batch)
+        else:
+            arrays = {"input": self._embedInputData(inputData), "xs": self._xs,
+                      "prediction": (inputData.shape[0], inputData.shape[1] - transientTime, int(np.prod(self.inputShape)))}
+            if not self._averageOutputWeights:
+                arrays["WOuts"] = self._WOuts
 
-            while nJobsDone < nJobs:
-                data = fitQueue.get()
+            blocks, shared, arraySpecs = self._createSharedArrays(arrays)
+            try:
+                self._runPool(spatioTemporalWorker.predictPixels, arraySpecs,
+                              {"transientTime": transientTime, "updateStates": not batch}, verbose)
 
-                # result of fitting
-                indices, x, WOut = data
-                id = self._uniqueIDFromIndices(indices)
+                if not batch:
+                    self._xs[...] = shared["xs"]
+                predictionOutput = shared["prediction"].reshape(inputData.shape[0], -1, *self.inputShape).copy()
+            finally:
+                del shared
+                self._releaseSharedArrays(blocks)
 
-                if WOut is None:
-                    import sys
-                    print("WARNING: Fit process for pixel {0} did not succeed".format(indices), file=sys.stderr)
+        return predictionOutput if batch else predictionOutput[0]
 
-                # store WOut
-                if self._averageOutputWeights:
-                    if WOut is not None:
-                        self._WOut += WOut / np.prod(self.inputShape)
-                else:
-                    self._WOuts[id] = WOut
+    """
+        Generates n frames autonomously: every predicted frame is fed back as the input of the next step.
+        initialData is either one frame (shape inputShape), which is the first input, or a sequence (shape (time, *inputShape)),
+        whose frames except the last one are propagated first (like predict) to warm up the states; the last frame is the
+        first input then. The frames are embedded and the patches are extracted inside the loop, while the states of all
+        pixels stay resident and are advanced in place (see _stepFrame) for every engine. Returns the generated frames
+        with the shape (n, *inputShape) and updates the states of the pixels.
+    """
+    def generate(self, n, initialData, verbose=0):
+        initialData = np.asarray(initialData)
+        if initialData.shape == tuple(self.inputShape):
+            frame = initialData
+        elif initialData.shape[1:] == tuple(self.inputShape):
+            if len(initialData) > 1:
+                self.predict(initialData[:-1], verbose=verbose)
+            frame = initialData[-1]
+        else:
+            raise ValueError("The `initialData` does not have a suitable shape. It has to be one frame with the shape {0} or "
+                             "a sequence of these frames.".format(tuple(self.inputShape)))
 
-                    # store x
-                self._xs[id] = x
+        nPixels = int(np.prod(self.inputShape))
+        if self._engine == "tiled" and self._storePath is not None:
+            generated = np.lib.format.open_memmap(os.path.join(self._storePath, "generation.npy"), mode="w+",
+                                                  dtype=np.float64, shape=(n, nPixels))
+        else:
+            generated = B.empty((n, nPixels))
 
-                nJobsDone += 1
-                if verbose > 0:
-                    bar.update(nJobsDone)
-                    if verbose > 1:
-                        print(nJobsDone)
+        if verbose > 0:
+            bar = progressbar.ProgressBar(max_value=n, redirect_stdout=True, poll_interval=0.0001)
+            bar.update(0)
+
+        for i in range(n):
+            self._stepFrame(frame, generated[i])
+            frame = generated[i].reshape(self.inputShape)
 
             if verbose > 0:
-                bar.finish()
+                bar.update(i + 1)
 
-        _processPoolWorkerResults()
+        if verbose > 0:
+            bar.finish()
 
-        pool.close()
+        self._flushStores()
 
+        return generated.reshape(n, *self.inputShape)
 
     """
-        Use the ESN in the predictive mode to predict the output signal by using an input signal.
+        Streams one new frame (shape inputShape): the states of all pixels are updated in place and the predicted frame
+        is returned. The border of the frame is embedded according to the borderMode. The states stay in _xs and the
+        threads stay alive between the calls (until close is called), so that a frame only costs one matrix product per tile.
     """
-    def predict(self, inputData, transientTime=0, update_processor=lambda x: x, verbose=0):
-        rank = len(inputData.shape) - 1
-
-        if rank != self.n_inputDimensions:
-            raise ValueError(
-                "The `inputData` does not have a suitable shape. It has to have {0} spatial dimensions and 1 temporal dimension.".format(
-                    self.n_inputDimensions))
+    def step(self, frame):
+        frame = np.asarray(frame)
+        if frame.shape != tuple(self.inputShape):
+            raise ValueError("The frame has the shape {0}, but the shape {1} was expected.".format(frame.shape, tuple(self.inputShape)))
 
-        manager = Manager()
-        predictQueue = manager.Queue()
+        prediction = B.empty(int(np.prod(self.inputShape)))
+        self._stepFrame(frame, prediction)
 
-        # workaround as predict does not support batches atm
-        # add dummy dimension to let embedInputData work properly (is optimized to work for batches)
-        inputData = inputData.reshape(1, *inputData.shape)
-        modifiedInputData = self._embedInputData(inputData)
-        modifiedInputData = modifiedInputData[0]
-        inputData = inputData[0]
+        return prediction.reshape(self.inputShape)
 
-        self.transientTime = transientTime
-        self.sharedNamespace.transientTime = transientTime
-        predictionOutput = B.zeros(np.insert(self.inputShape, 0, inputData.shape[0] - transientTime))
+    """
+        Advances all pixels by the frame and writes the prediction into output (shape (nPixels,)). The states are updated
+        in place through the transposed (n_reservoir, nTilePixels) views of _xs, tile by tile, using the persistent threads.
+    """
+    def _stepFrame(self, frame, output):
+        patches = self._extractPatches(self._embedInputData(frame.reshape(1, 1, *self.inputShape)))
 
-        jobs = np.stack(np.meshgrid(*[np.arange(x) + self._filterWidth for x in inputData.shape[1:]]),
-                        axis=rank).reshape(-1, rank).tolist()
-        nJobs = len(jobs)
+        def stepTile(tile):
+            x = self._xs[tile, :, 0].T
+            u = self._tilePatches(patches, 0, 0, tile).T
+            self.updateBatch(x, u)
 
-        self.resetState()
+            #apply the output weights to the extended state [outputBias; u; x] without stacking it
+            n = 1 + self.n_input
+            if self._averageOutputWeights:
+                WOut = self._WOut[0]
+                y = WOut[0] * self._outputBias + self._outputInputScaling * B.dot(WOut[1:n], u) + B.dot(WOut[n:], x)
+            else:
+                WOut = self._WOuts[tile, 0]
+                y = WOut[:, 0] * self._outputBias + self._outputInputScaling * np.einsum("pd,dp->p", WOut[:, 1:n], u) + \
+                    np.einsum("pd,dp->p", WOut[:, n:], x)
+            output[tile] = self.out_activation(y)
+
+        tiles = self._pixelTiles(1)
+        if len(tiles) > 1 and self._nWorkers > 1:
+            self._getThreadPool().map(stepTile, tiles)
+        else:
+            for tile in tiles:
+                stepTile(tile)
 
-        iterator = PredictionArrayIterator(modifiedInputData, jobs, self._filterWidth, self._stride, self)
+    def _getThreadPool(self):
+        if self._threadPool is None:
+            self._threadPool = ThreadPool(processes=self._nWorkers)
+        return self._threadPool
 
-        pool = Pool(processes=self._nWorkers, initializer=SpatioTemporalESN._init_predictProcess,
-                    initargs=[predictQueue, self])
-        pool.map_async(self._predictProcess, iterator, chunksize=200)#, chunksize=1)
+    """
+        Splits the rows of the grid into the shards for the executor. Returns the pixel slices of the shards.
+    """
+    def _shards(self):
+        rowPixels = int(np.prod(self.inputShape[1:]))
+        nShards = self._nShards if self._nShards is not None else self._nWorkers
+        rows = np.array_split(np.arange(self.inputShape[0]), min(nShards, self.inputShape[0]))
+        return [slice(int(r[0]) * rowPixels, (int(r[-1]) + 1) * rowPixels) for r in rows]
 
-        def _processPoolWorkerResults():
-            nJobsDone = 0
+    """
+        Returns the serialized copy of the ESN, which is sent to the shards. It is serialized by dill, so that the
+        executor only has to pickle bytes and numpy arrays. Inside of a shard, the vectorized engine is used by one thread.
+    """
+    def _shardModel(self):
+        esn = self._workerCopy()
+        esn._engine = "vectorized"
+        esn._nWorkers = 1
+        esn._storePath = None
+        return dill.dumps(esn)
 
+    """
+        Waits for the futures of the shards and returns their results in the order of the shards.
+    """
+    def _collectShards(self, futures, verbose=0):
+        if verbose > 0:
+            bar = progressbar.ProgressBar(max_value=len(futures), redirect_stdout=True, poll_interval=0.0001)
+            bar.update(0)
+
+        results = []
+        for future in futures:
+            results.append(future.result())
             if verbose > 0:
-                bar = progressbar.ProgressBar(max_value=nJobs, redirect_stdout=True, poll_interval=0.0001)
-                bar.update(0)
-
-            while nJobsDone < nJobs:
-                data = predictQueue.get()
-                # result of predicting
-                indices, prediction, state = data
-                id = self._uniqueIDFromIndices(indices)
-                self._xs[id] = state
-                # update the values
-                predictionOutput[tuple([Ellipsis] + indices)] = prediction
-
-                nJobsDone += 1
-                if verbose > 0:
-                    bar.update(nJobsDone)
-                    if verbose > 1:
-                        print(nJobsDone)
+                bar.update(len(results))
 
-            if verbose > 0:
-                bar.finish()
+        if verbose > 0:
+            bar.finish()
 
-        _processPoolWorkerResults()
+        return results
 
-        pool.close()
+    """
+        Fits the shards of the grid using the executor and merges their states and output weights.
+    """
+    def _fitSharded(self, inputData, outputData, transientTime, verbose):
+        rowPixels = int(np.prod(self.inputShape[1:]))
+        shards = self._shards()
+        model = self._shardModel()
+
+        futures = []
+        for shard in shards:
+            rows = slice(shard.start // rowPixels, shard.stop // rowPixels)
+            WOuts = None if self._averageOutputWeights else np.asarray(self._WOuts[shard])
+            futures.append(self._executor.submit(spatioTemporalWorker.fitShard, model, self._embedTile(inputData, shard),
+                                                 np.asarray(outputData[:, :, rows]), np.asarray(self._xs[shard]), WOuts, transientTime))
+
+        partials = []
+        for shard, (xs, WOuts, partial) in zip(shards, self._collectShards(futures, verbose)):
+            self._xs[shard] = xs
+            if not self._averageOutputWeights:
+                self._WOuts[shard] = WOuts
+            partials.append(partial)
+
+        self._finishReadout(self._mergePartialReadouts(partials))
+        self._flushStores()
 
-        return predictionOutput
+    """
+        Predicts the shards of the grid using the executor and merges their predictions (and states).
+        Returns the prediction with the shape (series, time-transientTime, *inputShape).
+    """
+    def _predictSharded(self, inputData, transientTime, verbose, updateStates=True):
+        shards = self._shards()
+        model = self._shardModel()
 
-    def _uniqueIDFromIndices(self, indices):
-        id = indices[-1]
+        futures = []
+        for shard in shards:
+            WOuts = None if self._averageOutputWeights else np.asarray(self._WOuts[shard])
+            futures.append(self._executor.submit(spatioTemporalWorker.predictShard, model, self._embedTile(inputData, shard),
+                                                 np.asarray(self._xs[shard]), WOuts, transientTime, updateStates))
 
-        if len(indices) != len(self.inputShape):
-            raise ValueError("Shape if `indices` does not match the `inputShape` of the SpatioTemporalESN.")
+        predictionOutput = B.empty((inputData.shape[0], inputData.shape[1] - transientTime, int(np.prod(self.inputShape))))
+        for shard, (xs, prediction) in zip(shards, self._collectShards(futures, verbose)):
+            self._xs[shard] = xs
+            predictionOutput[:, :, shard] = prediction
 
-        if len(self.inputShape) > 1:
-            for i in range(0, len(self.inputShape) - 1):
-                id += self.inputShape[i + 1] * indices[i]
+        self._flushStores()
 
-        return id
+        return predictionOutput.reshape(inputData.shape[0], -1, *self.inputShape)
 
+    """
+        Creates a shared array for every entry of arrays, which is either an array, whose data is copied, or the shape
+        of a new array. Returns the shared memory blocks, the shared arrays and their specs.
+    """
     @staticmethod
-    def _init_fitProcess(fitQueue, self):
-        SpatioTemporalESN._fitProcess.fitQueue = fitQueue
-        SpatioTemporalESN._fitProcess.self = self
-
-    def _fitProcess(self, data):
+    def _createSharedArrays(arrays):
+        blocks, shared, arraySpecs = [], {}, {}
         try:
-            inData, outData, indices, state = data
-            transientTime = self.sharedNamespace.transientTime
+            for key, data in arrays.items():
+                if isinstance(data, tuple):
+                    block, shared[key], arraySpecs[key] = hp.createSharedArray(data)
+                else:
+                    block, shared[key], arraySpecs[key] = hp.createSharedArray(data.shape, data.dtype, data)
+                blocks.append(block)
+        except Exception:
+            shared.clear()
+            SpatioTemporalESN._releaseSharedArrays(blocks)
+            raise
+
+        return blocks, shared, arraySpecs
+
+    @staticmethod
+    def _releaseSharedArrays(blocks):
+        for block in blocks:
+            block.close()
+            block.unlink()
+
+    """
+        Returns a copy of the ESN for the pool workers without the per pixel states and output weights, which are
+        shared with the workers instead.
+    """
+    def _workerCopy(self):
+        esn = copy.copy(self)
+        esn._xs = None
+        esn._WOuts = None
+        return esn
+
+    """
+        Returns the persistent pool. If the ESN creates it, the workers are initialized with a copy of the ESN once and
+        a snapshot of this copy is kept to compute the model deltas of later calls. The pool is terminated when the ESN
+        is garbage collected without being closed.
+    """
+    def _getPool(self):
+        if self._pool is None:
+            esn = self._workerCopy()
+            self._pool = Pool(processes=self._nWorkers, initializer=spatioTemporalWorker.initWorker, initargs=[self._modelID, esn])
+            self._ownsPool = True
+            self._poolFinalizer = weakref.finalize(self, self._pool.terminate)
+            self._poolSnapshot = {key: value.copy() if isinstance(value, np.ndarray) else value for key, value in esn.__dict__.items()}
+        return self._pool
 
-            partialLength = self.sharedNamespace.partialLength
-            totalLength = self.sharedNamespace.totalLength
-            timeseriesCount = self.sharedNamespace.timeseriesCount
+    """
+        Returns the attributes of the worker copy which differ from the snapshot the workers have been initialized with.
+        The delta is always relative to this snapshot, as not every worker receives a chunk of every call.
+    """
+    def _modelDelta(self):
+        def sameValue(a, b):
+            if a is b:
+                return True
+            if isinstance(a, np.ndarray) or isinstance(b, np.ndarray):
+                return isinstance(a, np.ndarray) and isinstance(b, np.ndarray) and a.shape == b.shape and np.array_equal(a, b)
+            try:
+                return bool(a == b)
+            except Exception:
+                return False
 
-            workerID = self.parallelWorkerIDs.get()
-            self._x[workerID] = state
+        missing = object()
+        return {key: value for key, value in self._workerCopy().__dict__.items()
+                if key != "_poolGeneration" and not sameValue(value, self._poolSnapshot.get(key, missing))}
 
-            # propagate
-            X = B.empty((1 + self.n_input + self.n_reservoir, totalLength))
+    """
+        Runs function (spatioTemporalWorker.fitPixels or predictPixels) for chunks of pixels using the persistent pool.
+        The workers attach the shared arrays once per call. The model delta (or the whole ESN for an external pool, whose
+        workers do not know it) is shared with them once per call as well, so that the chunks only contain the spec of
+        its shared block. Returns the results of the chunks.
+    """
+    def _runPool(self, function, arraySpecs, parameters, verbose=0):
+        nPixels = int(np.prod(self.inputShape))
+        chunks = [chunk.tolist() for chunk in np.array_split(np.arange(nPixels), min(nPixels, 4 * self._nWorkers))]
 
-            for i in range(timeseriesCount):
-                X[:, i * partialLength:(i + 1) * partialLength] = self.propagate(inData[i], transientTime=transientTime,
-                                                                                 x=self._x[workerID], verbose=0)
+        pool = self._getPool()
+        self._poolGeneration += 1
 
-            # define the target values
-            Y_target = B.empty((1, totalLength))
-            for i in range(timeseriesCount):
-                Y_target[:, i * partialLength:(i + 1) * partialLength] = self.out_inverse_activation(outData[i]).T[:,
-                                                                         transientTime:]
+        model = {"delta": self._modelDelta()} if self._ownsPool else {"esn": self._workerCopy()}
+        model = np.frombuffer(dill.dumps(model), dtype=np.uint8)
+        block, shared, modelSpec = hp.createSharedArray(model.shape, model.dtype, model)
+        del shared
+        modelBlocks = [block]
 
-            # now fit
-            WOut = None
-            if self._solver == "pinv":
-                WOut = B.dot(Y_target, B.pinv(X))
+        setup = {"generation": (self._modelID, self._poolGeneration), "modelID": self._modelID,
+                 "model": modelSpec, "arrays": arraySpecs, "parameters": parameters}
 
-            elif self._solver == "lsqr":
-                X_T = X.T
-                WOut = B.dot(B.dot(Y_target, X_T), B.inv(
-                    B.dot(X, X_T) + self._regressionParameters[0] * B.identity(1 + self.n_input + self.n_reservoir)))
+        if verbose > 0:
+            bar = progressbar.ProgressBar(max_value=nPixels, redirect_stdout=True, poll_interval=0.0001)
+            bar.update(0)
 
-            # calculate the training prediction now
-            # trainingPrediction = self.out_activation(B.dot(WOut, X).T)
+        results = []
+        nJobsDone = 0
+        try:
+            for result in pool.imap_unordered(function, [(setup, chunk) for chunk in chunks]):
+                results.append(result)
+                nJobsDone += result[0]
+                if verbose > 0:
+                    bar.update(nJobsDone)
+        finally:
+            self._releaseSharedArrays(modelBlocks)
 
-            # store the state and the output matrix of the worker
-            SpatioTemporalESN._fitProcess.fitQueue.put(
-                ([x - self._filterWidth for x in indices], self._x[workerID].copy(), WOut.copy()))
+        if verbose > 0:
+            bar.finish()
 
-            self.parallelWorkerIDs.put(workerID)
+        return results
 
-        except Exception as ex:
-            print(ex)
-            import traceback
-            traceback.print_exc()
+    """
+        Returns a strided view of the input patches of all pixels without copying the input. modifiedInputData is the
+        embedded input with the shape (series, time, *paddedShape); the view has the shape (series, time, *inputShape, *window),
+        where window contains the strided filter window (ceil(filterSize/stride) values per spatial dimension).
+    """
+    def _extractPatches(self, modifiedInputData):
+        rank = self.n_inputDimensions
+        patches = np.lib.stride_tricks.sliding_window_view(modifiedInputData, (self._filterSize,) * rank,
+                                                           axis=tuple(range(2, 2 + rank)))
+        return patches[(Ellipsis,) + (slice(None, None, self._stride),) * rank]
 
-            SpatioTemporalESN._fitProcess.fitQueue.put(([x - self._filterWidth for x in indices], None, None))
+    """
+        Returns the inputs of the pixels of the tile at the time t of the series i with the shape (nTilePixels, n_input).
+        Only these inputs are copied out of the patch view, as the tile consists of whole rows (of the first spatial dimension).
+    """
+    def _tilePatches(self, patches, i, t, tile, firstRow=0):
+        rowPixels = int(np.prod(self.inputShape[1:]))
+        return patches[i, t, tile.start // rowPixels - firstRow:tile.stop // rowPixels - firstRow].reshape(-1, self.n_input)
 
-            self.parallelWorkerIDs.put(workerID)
+    """
+        Returns the patches for the tile and the first row they cover: the tiled engine embeds the rows of every tile
+        separately, the vectorized engine uses the patches of the whole input.
+    """
+    def _patchesOfTile(self, inputData, patches, tile):
+        if self._engine == "tiled":
+            return self._extractPatches(self._embedTile(inputData, tile)), tile.start // int(np.prod(self.inputShape[1:]))
+        return patches, 0
 
-    @staticmethod
-    def _init_predictProcess(predictQueue, self):
-        SpatioTemporalESN._predictProcess.predictQueue = predictQueue
-        SpatioTemporalESN._predictProcess.self = self
+    """
+        Splits the pixels into tiles of whole rows, which are processed independently by the vectorized engine.
+    """
+    def _pixelTiles(self, length):
+        nPixels = int(np.prod(self.inputShape))
+        rowPixels = int(np.prod(self.inputShape[1:]))
+        tileSize = self._tileSize
+        if tileSize is None:
+            #distribute the pixels among the workers, but keep the collected states of a tile below 256MB
+            tileSize = int(np.ceil(nPixels / self._nWorkers))
+            tileSize = max(1, min(tileSize, 2**25 // (length * (1 + self.n_input + self.n_reservoir))))
+        tileSize = int(np.ceil(tileSize / rowPixels)) * rowPixels
+
+        return [slice(i, min(i + tileSize, nPixels)) for i in range(0, nPixels, tileSize)]
 
-    def _predictProcess(self, data):
+    """
+        Applies function to all tiles using nWorkers threads and returns the results in the order of the tiles.
+    """
+    def _mapTiles(self, function, tiles, verbose=0):
+        if verbose > 0:
+            bar = progressbar.ProgressBar(max_value=len(tiles), redirect_stdout=True, poll_interval=0.0001)
+            bar.update(0)
+
+        results = []
+        pool = ThreadPool(processes=max(1, min(self._nWorkers, len(tiles))))
         try:
-            inData, indices, state = data
-            transientTime = self.sharedNamespace.transientTime
-            workerID = self.parallelWorkerIDs.get()
-            # get internal id
-            id = self._uniqueIDFromIndices([x - self._filterWidth for x in indices])
+            for result in pool.imap(function, tiles):
+                results.append(result)
+                if verbose > 0:
+                    bar.update(len(results))
+        finally:
+            pool.close()
+            pool.join()
 
-            # self._x[workerID] = state # self.sharedNamespace.xs[id]
+        if verbose > 0:
+            bar.finish()
 
-            # now fit
-            X = self.propagate(inData, transientTime=transientTime, x=state, verbose=0)
+        return results
 
-            # state = self._x[workerID]
+    """
+        Propagates the pixels of the tile for all series with one matrix product per time step. The pixels start from their
+        states in _xs, into which their final states are written back.
+        Returns the extended states [outputBias; u; x] of all steps after the transientTime with the shape
+        (series*(time-transientTime), 1+n_input+n_reservoir, nTilePixels).
+    """
+    def _propagatePixels(self, patches, tile, transientTime, firstRow=0):
+        nSeries, length = patches.shape[:2]
+        partialLength = length - transientTime
 
+        x = self._xs[tile, :, 0].T.copy()
+        X = B.empty((nSeries * partialLength, 1 + self.n_input + self.n_reservoir, x.shape[1]))
+        X[:, 0, :] = self._outputBias
+
+        for i in range(nSeries):
+            for t in range(length):
+                u = self._tilePatches(patches, i, t, tile, firstRow).T
+                self.updateBatch(x, u)
+                if t >= transientTime:
+                    X[i * partialLength + t - transientTime, 1:1 + self.n_input] = self._outputInputScaling * u
+                    X[i * partialLength + t - transientTime, 1 + self.n_input:] = x
+
+        self._xs[tile, :, 0] = x.T
+
+        return X
+
+    """
+        Fits all pixels with the vectorized or tiled engine. inputData and outputData have the shape (series, time, *inputShape).
+    """
+    def _fitVectorized(self, inputData, outputData, transientTime, verbose):
+        self._finishReadout(self._fitTiles(inputData, outputData, transientTime, verbose))
+        self._flushStores()
+
+    """
+        Fits the tiles of pixels, stores their states and (unless averageOutputWeights is set) their output weights.
+        Returns the partial result of the shared readout (see _mergePartialReadouts). If patches is None, they are
+        extracted from inputData (or per tile by the tiled engine).
+    """
+    def _fitTiles(self, inputData, outputData, transientTime, verbose=0, patches=None):
+        nSeries, length = inputData.shape[:2]
+        partialLength = length - transientTime
+        rowPixels = int(np.prod(self.inputShape[1:]))
+
+        if patches is None and self._engine == "vectorized":
+            patches = self._extractPatches(self._embedInputData(inputData))
+
+        def fitTile(tile):
+            tilePatches, firstRow = self._patchesOfTile(inputData, patches, tile)
+            X = self._propagatePixels(tilePatches, tile, transientTime, firstRow).transpose(2, 1, 0)
+
+            #target values of the pixels of the tile with the shape (nTilePixels, 1, series*(time-transientTime))
+            Y_target = np.asarray(outputData[:, transientTime:, tile.start // rowPixels:tile.stop // rowPixels])
+            Y_target = self.out_inverse_activation(Y_target.reshape(nSeries * partialLength, -1).T).reshape(-1, 1, nSeries * partialLength)
+
+            if self._averageOutputWeights == "pooled":
+                #the extended states of all pixels of the tile are the columns of one design matrix
+                X = X.transpose(1, 0, 2).reshape(X.shape[1], -1)
+                return B.dot(X, X.T), B.dot(Y_target.reshape(1, -1), X.T)
+            elif self._solver == "pinv":
+                return np.matmul(Y_target, np.linalg.pinv(X))
+            else:
+                X_T = X.transpose(0, 2, 1)
+                XXT = np.matmul(X, X_T) + self._regressionParameters[0] * B.identity(X.shape[1])
+                return np.linalg.solve(XXT, np.matmul(Y_target, X_T).transpose(0, 2, 1)).transpose(0, 2, 1)
+
+        tiles = self._pixelTiles(nSeries * length)
+        WOuts = self._mapTiles(fitTile, tiles, verbose)
+
+        if self._averageOutputWeights == "pooled":
+            return self._mergePartialReadouts(WOuts)
+        elif self._averageOutputWeights:
+            return self._mergePartialReadouts([WOut.sum(axis=0) for WOut in WOuts])
+        else:
+            for tile, WOut in zip(tiles, WOuts):
+                self._WOuts[tile] = WOut
+
+    """
+        Propagates the independent sequences of patches side by side: the states of the pixels of the tile are repeated
+        for every series, so that all series start from the current states and are advanced by one matrix product per
+        time step. The final states are only written back into _xs if updateStates is set (for a single series).
+        Returns the extended states with the shape (time-transientTime, 1+n_input+n_reservoir, series*nTilePixels).
+    """
+    def _propagateSequences(self, patches, tile, transientTime, firstRow=0, updateStates=False):
+        nSeries, length = patches.shape[:2]
+
+        x = np.tile(self._xs[tile, :, 0].T, (1, nSeries))
+        X = B.empty((length - transientTime, 1 + self.n_input + self.n_reservoir, x.shape[1]))
+        X[:, 0, :] = self._outputBias
+
+        for t in range(length):
+            u = np.concatenate([self._tilePatches(patches, i, t, tile, firstRow) for i in range(nSeries)]).T
+            self.updateBatch(x, u)
+            if t >= transientTime:
+                X[t - transientTime, 1:1 + self.n_input] = self._outputInputScaling * u
+                X[t - transientTime, 1 + self.n_input:] = x
+
+        if updateStates:
+            self._xs[tile, :, 0] = x.T
+
+        return X
+
+    """
+        Predicts all pixels with the vectorized or tiled engine. inputData has the shape (series, time, *inputShape).
+        Returns the prediction with the shape (series, time-transientTime, *inputShape).
+    """
+    def _predictVectorized(self, inputData, transientTime, verbose, updateStates=True, patches=None):
+        nSeries, length = inputData.shape[:2]
+        shape = (nSeries, length - transientTime, int(np.prod(self.inputShape)))
+
+        if patches is None and self._engine == "vectorized":
+            patches = self._extractPatches(self._embedInputData(inputData))
+        if self._engine == "tiled" and self._storePath is not None:
+            predictionOutput = np.lib.format.open_memmap(os.path.join(self._storePath, "prediction.npy"), mode="w+",
+                                                         dtype=np.float64, shape=shape)
+        else:
+            predictionOutput = B.empty(shape)
+
+        def predictTile(tile):
+            tilePatches, firstRow = self._patchesOfTile(inputData, patches, tile)
+            X = self._propagateSequences(tilePatches, tile, transientTime, firstRow, updateStates and nSeries == 1)
             if self._averageOutputWeights:
-                WOut = self._WOut
+                Y = np.einsum("d,tdp->tp", self._WOut[0], X)
             else:
-                WOut = self._WOuts[id]
+                Y = np.einsum("pd,tdp->tp", np.tile(self._WOuts[tile, 0], (nSeries, 1)), X)
+            predictionOutput[:, :, tile] = self.out_activation(Y).reshape(length - transientTime, nSeries, -1).transpose(1, 0, 2)
+
+        self._mapTiles(predictTile, self._pixelTiles(nSeries * length), verbose)
+        self._flushStores()
+
+        return predictionOutput.reshape(nSeries, length - transientTime, *self.inputShape)
+
+    def _uniqueIDFromIndices(self, indices):
+        if len(indices) != len(self.inputShape):
+            raise ValueError("Shape if `indices` does not match the `inputShape` of the SpatioTemporalESN.")
+
+        return int(np.ravel_multi_index(tuple(indices), tuple(self.inputShape)))
+
+    """
+        Fits the output weights of one pixel. inData has the shape (series, time, *window) and outData (series, time).
+        The state x of the pixel is updated in place. Returns the output weights.
+    """
+    def _fitPixel(self, inData, outData, x, transientTime):
+        X, Y_target = self._propagatePixel(inData, outData, x, transientTime)
+
+        # now fit
+        if self._solver == "pinv":
+            WOut = B.dot(Y_target, B.pinv(X))
+        else:
+            X_T = X.T
+            WOut = B.dot(B.dot(Y_target, X_T), B.inv(
+                B.dot(X, X_T) + self._regressionParameters[0] * B.identity(1 + self.n_input + self.n_reservoir)))
 
-            # calculate the actual prediction
-            prediction = self.out_activation(B.dot(WOut, X).T)[:, 0]
+        return WOut
+
+    """
+        Propagates one pixel like _fitPixel. Returns the extended states X and the target values Y_target of the pixel.
+    """
+    def _propagatePixel(self, inData, outData, x, transientTime):
+        timeseriesCount, length = inData.shape[:2]
+        inData = inData.reshape(timeseriesCount, length, -1)
+        partialLength = length - transientTime
+        totalLength = timeseriesCount * partialLength
 
-            # store the state and the output matrix of the worker
-            SpatioTemporalESN._predictProcess.predictQueue.put(([x - self._filterWidth for x in indices], prediction, state))
+        # propagate
+        X = B.empty((1 + self.n_input + self.n_reservoir, totalLength))
+        for i in range(timeseriesCount):
+            X[:, i * partialLength:(i + 1) * partialLength] = self.propagate(inData[i], transientTime=transientTime,
+                                                                             x=x, verbose=0)
+
+        # define the target values
+        Y_target = self.out_inverse_activation(outData[:, transientTime:]).reshape(1, totalLength)
+
+        return X, Y_target
+
+    """
+        Predicts one pixel. inData has the shape (time, *window); the state x of the pixel is updated in place.
+    """
+    def _predictPixel(self, inData, WOut, x, transientTime):
+        X = self.propagate(inData.reshape(len(inData), -1), transientTime=transientTime, x=x, verbose=0)
 
-            self.parallelWorkerIDs.put(workerID)
-        except Exception as ex:
-            print(ex)
-            import traceback
-            traceback.print_exc()
\ No newline at end of file
+        # calculate the actual prediction
+        return self.out_activation(B.dot(WOut, X).T)[:, 0]
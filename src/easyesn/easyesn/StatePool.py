@@ -0,0 +1,87 @@
+"""
+    Preallocated storage for reservoir states, used to snapshot, fork and restore states of an ESN.
+"""
+
+from . import backend as B
+
+
+class StatePool(object):
+    """
+    Stores reservoir states as the columns of one preallocated (n_reservoir, capacity) array. Named snapshots of a state
+    can be forked into a contiguous block of columns, which can directly be advanced by PredictionESN.stepBatch, so that
+    scenario forecasts from the same state do not need to repeat the transient phase. The capacity is doubled if necessary.
+    """
+
+    def __init__(self, n_reservoir, capacity=64):
+        self.n_reservoir = n_reservoir
+        self._states = B.zeros((n_reservoir, capacity))
+        self._free = list(range(capacity))[::-1]
+        self._snapshots = {}
+
+    def _allocate(self, n):
+        while len(self._free) < n:
+            capacity = self._states.shape[1]
+            self._states = B.concatenate((self._states, B.zeros(self._states.shape)), axis=1)
+            self._free = list(range(2*capacity - 1, capacity - 1, -1)) + self._free
+
+        #prefer contiguous blocks, so that the states of a fork can be accessed as a view
+        self._free.sort(reverse=True)
+        return [self._free.pop() for _ in range(n)]
+
+    """
+        Stores a copy of `state` (e.g. esn.getState()) under the name `name`.
+    """
+    def snapshot(self, name, state):
+        if name in self._snapshots:
+            self.release(name)
+        index = self._allocate(1)
+        self._states[:, index[0]] = B.array(state).reshape(-1)
+        self._snapshots[name] = index
+
+    """
+        Returns a copy of the snapshot `name` with the shape (n_reservoir, 1), which can be passed to BaseESN.setState.
+    """
+    def restore(self, name):
+        return self._states[:, self._snapshots[name]].copy()
+
+    """
+        Copies the snapshot `name` into n new columns of the pool and stores them under `forkName`.
+        Returns the indices of these columns.
+    """
+    def fork(self, name, n, forkName=None):
+        indices = self._allocate(n)
+        self._states[:, indices] = self._states[:, self._snapshots[name]]
+        if forkName is not None:
+            if forkName in self._snapshots:
+                self.release(forkName)
+            self._snapshots[forkName] = indices
+        return indices
+
+    """
+        Returns the states of the columns `indices` (or of the snapshot/fork with this name) as a (n_reservoir, n) matrix.
+        If the columns are contiguous, a view is returned, so that stepBatch updates the states of the pool in place.
+    """
+    def get(self, indices):
+        if not isinstance(indices, list):
+            indices = self._snapshots[indices]
+        if len(indices) > 0 and indices == list(range(indices[0], indices[0] + len(indices))):
+            return self._states[:, indices[0]:indices[0] + len(indices)]
+        return self._states[:, indices]
+
+    """
+        Writes the states (shape (n_reservoir, n)) back into the columns `indices` (or the snapshot/fork with this name).
+    """
+    def set(self, indices, states):
+        if not isinstance(indices, list):
+            indices = self._snapshots[indices]
+        self._states[:, indices] = states
+
+    """
+        Releases the columns of the snapshot/fork `name` (or the list of column indices).
+    """
+    def release(self, name):
+        if isinstance(name, list):
+            indices = name
+        else:
+            indices = self._snapshots.pop(name)
+        self._free.extend(indices)
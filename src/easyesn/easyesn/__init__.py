@@ -4,3 +4,5 @@ from .ClassificationESN import ClassificationESN
 from .SpatioTemporalESN import SpatioTemporalESN
 
 from .OneHotEncoder import OneHotEncoder
+from .InferenceEngine import InferenceEngine
+from .StatePool import StatePool
\ No newline at end of file
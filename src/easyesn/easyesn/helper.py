@@ -74,3 +74,142 @@ def SWD(series, intervall):
 
 def loss(prediction, target):
     return np.mean( ( prediction - target ) ** 2 )
+
+
+"""
+    Lazily loads the (input, output) sequence pairs stored inside the directory `path`.
+    Every sequence is stored as `<name>_input.npy` and `<name>_output.npy`; the input file may be missing
+    for ESNs without any input (n_input=0). The arrays are opened as read-only memory maps.
+"""
+def loadSequenceDirectory(path, mmapMode="r"):
+    import os
+
+    outputFiles = sorted([f for f in os.listdir(path) if f.endswith("_output.npy")])
+    if len(outputFiles) == 0:
+        raise ValueError("The directory {0} does not contain any `*_output.npy` files.".format(path))
+
+    for outputFile in outputFiles:
+        inputFile = os.path.join(path, outputFile[:-len("_output.npy")] + "_input.npy")
+        outputData = np.load(os.path.join(path, outputFile), mmap_mode=mmapMode)
+        inputData = np.load(inputFile, mmap_mode=mmapMode) if os.path.exists(inputFile) else None
+
+        yield inputData, outputData
+
+
+"""
+    Iterates over the (input, output) pairs of `sequences` while the next pair is already loaded into memory by a
+    background thread. Memory mapped arrays are read completely by the thread, so that the I/O overlaps with the propagation.
+    The thread is stopped as well if the iteration ends early (e.g. by an error of the consumer).
+"""
+def prefetchSequences(sequences, bufferSize=1):
+    import threading
+    import queue
+
+    buffer = queue.Queue(maxsize=bufferSize)
+    stop = threading.Event()
+    sentinel = object()
+
+    #waits for free space in the buffer, unless the consumer has stopped
+    def put(item):
+        while not stop.is_set():
+            try:
+                buffer.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def load():
+        try:
+            for inputData, outputData in sequences:
+                if inputData is not None:
+                    inputData = np.array(inputData)
+                if not put((inputData, np.array(outputData))):
+                    return
+        except Exception as ex:
+            put(ex)
+        put(sentinel)
+
+    thread = threading.Thread(target=load, daemon=True)
+    thread.start()
+
+    try:
+        while True:
+            item = buffer.get()
+            if item is sentinel:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        #stop the loader (also if the consumer stops early or raises) and release the loaded sequences
+        stop.set()
+        while True:
+            try:
+                buffer.get_nowait()
+            except queue.Empty:
+                break
+        thread.join()
+
+
+"""
+    Returns True if `data` describes a collection of sequences (a directory or an iterable of (input, output) pairs)
+    instead of a single array.
+"""
+def isSequenceCollection(data):
+    return isinstance(data, str) or (data is not None and not hasattr(data, "shape"))
+
+
+"""
+    Opens a sequence collection, which is either a directory of `.npy` files or an iterable of (input, output) pairs.
+"""
+def openSequenceCollection(data, prefetch=True):
+    if isinstance(data, str):
+        data = loadSequenceDirectory(data)
+
+    if prefetch:
+        return prefetchSequences(data)
+    else:
+        return iter(data)
+
+
+"""
+    Splits packed sequences (all sequences concatenated along the first axis) into a list of views, using the offsets of
+    the sequences. offsets has either nSequences entries (the start of each sequence) or nSequences+1 entries (including the end).
+"""
+def unpackSequences(packedData, offsets):
+    offsets = list(offsets)
+    if offsets[-1] != len(packedData):
+        offsets.append(len(packedData))
+
+    return [packedData[offsets[i]:offsets[i+1]] for i in range(len(offsets)-1)]
+
+
+"""
+    Creates an array in a new shared memory block, which can be attached by other processes using attachSharedArray.
+    If data is given, it is copied into the array. Returns the shared memory block, which has to be closed and unlinked
+    by the caller, the array and its spec (name, shape, dtype).
+"""
+def createSharedArray(shape, dtype=np.float64, data=None):
+    from multiprocessing import shared_memory
+
+    shape = tuple(int(n) for n in shape)
+    dtype = np.dtype(dtype)
+    block = shared_memory.SharedMemory(create=True, size=max(1, int(np.prod(shape)) * dtype.itemsize))
+    array = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+    if data is not None:
+        array[...] = data
+
+    return block, array, (block.name, shape, dtype.str)
+
+
+"""
+    Attaches the shared array described by spec (see createSharedArray). Returns the shared memory block, which has to
+    be kept alive as long as the array is used, and the array.
+"""
+def attachSharedArray(spec):
+    from multiprocessing import shared_memory
+
+    name, shape, dtype = spec
+    block = shared_memory.SharedMemory(name=name)
+    return block, np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)
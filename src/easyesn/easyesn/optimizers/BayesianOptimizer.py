@@ -0,0 +1,231 @@
+"""
+    Model-based search for ESNs, in which the hyperparameters are proposed by a Gaussian process surrogate of the past results.
+"""
+
+import numpy as np
+import scipy.linalg
+import scipy.optimize
+import scipy.stats
+import progressbar
+
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+from .GridSearchOptimizer import GridSearchOptimizer
+
+class BayesianOptimizer(object):
+    """
+    Searches continuous hyperparameters (e.g. spectralRadius, leakingRate, inputScaling, regressionParameters) of ESNs with
+    a Gaussian process surrogate (Matern 5/2 kernel) of the logarithm of the validation MSE. After nInitialPoints points of a
+    Latin hypercube design, every new point maximizes the expected improvement over nCandidates random candidates (if more
+    than nInitialPoints evaluations run in parallel, random points are evaluated until the first result is available).
+
+    The evaluations run asynchronously on a process pool: as soon as one of them finishes, a new point is proposed, so that
+    n_jobs evaluations are always in flight. Points which are still being evaluated are added to the surrogate with the mean
+    of the observed errors ("constant liar"), so that they are not proposed again.
+
+    parametersBounds maps the names of the hyperparameters to tuples (low, high) or (low, high, scale) with the scale
+    linear, log or int. The value of regressionParameters is passed as [value] to the ESN.
+    """
+
+    def __init__(self, esnType, parametersBounds={}, fixedParametersDictionary={}, nInitialPoints=10, nCandidates=2000, randomSeed=None):
+        for key, bounds in parametersBounds.items():
+            if len(bounds) not in [2, 3] or (len(bounds) == 3 and bounds[2] not in ["linear", "log", "int"]):
+                raise ValueError("The bounds of {0} have to be a tuple (low, high) or (low, high, scale) with the scale linear, log or int.".format(key))
+            if len(bounds) == 3 and bounds[2] == "log" and bounds[0] <= 0:
+                raise ValueError("The bounds of {0} have to be positive for the log scale.".format(key))
+
+        self.esnType = esnType
+        self.parametersBounds = parametersBounds
+        self.fixedParametersDictionary = fixedParametersDictionary
+        self.nInitialPoints = nInitialPoints
+        self.nCandidates = nCandidates
+        self.randomSeed = randomSeed
+
+    """
+        Maps the point z of the unit cube to the hyperparameters of the ESN.
+    """
+    def _toParameters(self, z):
+        params = {}
+        for value, (key, bounds) in zip(z, self.parametersBounds.items()):
+            low, high = bounds[:2]
+            scale = bounds[2] if len(bounds) == 3 else "linear"
+
+            if scale == "log":
+                value = float(np.exp(np.log(low) + value * (np.log(high) - np.log(low))))
+            elif scale == "int":
+                value = int(np.round(low + value * (high - low)))
+            else:
+                value = float(low + value * (high - low))
+
+            params[key] = [value] if key == "regressionParameters" else value
+        return params
+
+    """
+        Returns n points of a Latin hypercube design in the unit cube.
+    """
+    def _initialDesign(self, n):
+        dimension = len(self.parametersBounds)
+        return (np.array([self._random.permutation(n) for _ in range(dimension)]).T + self._random.rand(n, dimension)) / n
+
+    """
+        Calculates the Matern 5/2 kernel between the points Z1 and Z2 (shapes (n1, d) and (n2, d)).
+    """
+    @staticmethod
+    def _kernel(Z1, Z2, lengthScales):
+        distances = np.sqrt(np.sum(((Z1[:, None, :] - Z2[None, :, :]) / lengthScales)**2, axis=2))
+        return (1.0 + np.sqrt(5.0)*distances + 5.0/3.0*distances**2) * np.exp(-np.sqrt(5.0)*distances)
+
+    """
+        Fits the Gaussian process to the observations (Z, y): the length scales and the noise are chosen by maximizing the
+        marginal likelihood of the standardized observations. Returns the surrogate as a dictionary.
+    """
+    @staticmethod
+    def _fitSurrogate(Z, y):
+        mean, std = np.mean(y), np.std(y)
+        if std == 0:
+            std = 1.0
+        y = (y - mean) / std
+
+        def negativeLogLikelihood(theta):
+            lengthScales, noise = np.exp(theta[:-1]), np.exp(theta[-1])
+            K = BayesianOptimizer._kernel(Z, Z, lengthScales) + (noise + 1e-8) * np.identity(len(Z))
+            try:
+                L = scipy.linalg.cho_factor(K, lower=True)
+            except np.linalg.LinAlgError:
+                return 1e10
+            return 0.5 * np.dot(y, scipy.linalg.cho_solve(L, y)) + np.sum(np.log(np.diag(L[0])))
+
+        dimension = Z.shape[1]
+        bounds = [(np.log(1e-2), np.log(1e1))] * dimension + [(np.log(1e-6), np.log(1e-1))]
+        theta = scipy.optimize.minimize(negativeLogLikelihood, np.array([np.log(0.3)] * dimension + [np.log(1e-3)]),
+                                        method="L-BFGS-B", bounds=bounds).x
+
+        lengthScales, noise = np.exp(theta[:-1]), np.exp(theta[-1])
+        K = BayesianOptimizer._kernel(Z, Z, lengthScales) + (noise + 1e-8) * np.identity(len(Z))
+        L = scipy.linalg.cho_factor(K, lower=True)
+
+        return {"Z": Z, "L": L, "alpha": scipy.linalg.cho_solve(L, y), "lengthScales": lengthScales, "mean": mean, "std": std}
+
+    """
+        Predicts the mean and the standard deviation of the surrogate at the points Z.
+    """
+    @staticmethod
+    def _predict(surrogate, Z):
+        Ks = BayesianOptimizer._kernel(Z, surrogate["Z"], surrogate["lengthScales"])
+        mean = np.dot(Ks, surrogate["alpha"])
+        v = scipy.linalg.solve_triangular(surrogate["L"][0], Ks.T, lower=True)
+        variance = np.maximum(1.0 - np.sum(v**2, axis=0), 1e-12)
+        return surrogate["mean"] + surrogate["std"] * mean, surrogate["std"] * np.sqrt(variance)
+
+    """
+        Proposes the next point: maximizes the expected improvement over the best observation among random candidates
+        (and candidates close to the best point). pending contains the points which are still being evaluated.
+        Failed evaluations (nan) are treated like the worst observation.
+    """
+    def _propose(self, Z, y, pending):
+        y = np.where(np.isnan(y), np.nanmax(y) if np.any(np.isfinite(y)) else 0.0, y)
+        if len(pending) > 0:
+            Z = np.vstack([Z] + pending)
+            y = np.concatenate((y, np.ones(len(pending)) * np.mean(y)))
+
+        surrogate = BayesianOptimizer._fitSurrogate(Z, y)
+
+        best = np.min(y)
+        candidates = np.vstack((self._random.rand(self.nCandidates, Z.shape[1]),
+                                np.clip(Z[np.argmin(y)] + 0.05 * self._random.randn(self.nCandidates // 4, Z.shape[1]), 0.0, 1.0)))
+
+        mean, std = BayesianOptimizer._predict(surrogate, candidates)
+        improvement = (best - mean) / std
+        expectedImprovement = (best - mean) * scipy.stats.norm.cdf(improvement) + std * scipy.stats.norm.pdf(improvement)
+
+        return candidates[np.argmax(expectedImprovement)]
+
+    """
+        Searches the hyperparameters with nEvaluations fits of the ESN, of which n_jobs run in parallel.
+        Returns the results (validationMSE, trainingAccuracy, params) in the order in which they have been finished.
+        The best results parameters will be stored in _best_params.
+    """
+    def fit(self, trainingInput, trainingOutput, validationInput, validationOutput, transientTime, nEvaluations=50, verbose=1, n_jobs=1):
+        #a private random state, as the ESNs may reseed the global one (randomSeed)
+        self._random = np.random.RandomState(self.randomSeed)
+
+        if verbose > 0:
+            #initialize the progressbar to indicate the progress
+            metrics_widget = progressbar.widgets.FormatCustomText(' Loss:\t%(loss).2E', {'loss': np.nan})
+            bar = progressbar.ProgressBar(max_value=nEvaluations, redirect_stdout=True, widgets=[metrics_widget])
+            bar.widgets = bar.default_widgets() + [metrics_widget]
+            bar.update(0)
+
+        initialDesign = self._initialDesign(min(self.nInitialPoints, nEvaluations))
+
+        #the datasets are sent to the workers only once (see GridSearchOptimizer._shareDatasets)
+        datasets = [trainingInput, trainingOutput, validationInput, validationOutput]
+        blocks = []
+        executor = None
+        if n_jobs > 1:
+            blocks, descriptions = GridSearchOptimizer._shareDatasets(datasets)
+            executor = ProcessPoolExecutor(max_workers=n_jobs, initializer=GridSearchOptimizer._getScoreInit,
+                                           initargs=(descriptions, self.fixedParametersDictionary, transientTime, self.esnType))
+        else:
+            GridSearchOptimizer._getScoreInit([(False, data) for data in datasets], self.fixedParametersDictionary, transientTime, self.esnType)
+
+        Z = []
+        y = []
+        results = []
+        inFlight = {}
+        try:
+            while len(results) < nEvaluations:
+                #keep n_jobs evaluations in flight
+                while len(inFlight) < max(1, n_jobs) and len(Z) + len(inFlight) < nEvaluations:
+                    submitted = len(Z) + len(inFlight)
+                    if submitted < len(initialDesign):
+                        z = initialDesign[submitted]
+                    elif len(Z) == 0:
+                        #the surrogate needs at least one observation, so random points are evaluated until then
+                        z = self._random.rand(len(self.parametersBounds))
+                    else:
+                        z = self._propose(np.array(Z), np.array(y), list(inFlight.values()))
+
+                    job = (submitted, [self._toParameters(z)])
+                    if executor is None:
+                        inFlight[submitted] = z
+                        finished = [(submitted, GridSearchOptimizer._getScore(job))]
+                    else:
+                        inFlight[executor.submit(GridSearchOptimizer._getScore, job)] = z
+
+                if executor is not None:
+                    done, _ = wait(list(inFlight.keys()), return_when=FIRST_COMPLETED)
+                    finished = [(future, future.result()) for future in done]
+
+                for key, (_, (dat,)) in finished:
+                    Z.append(inFlight.pop(key))
+                    y.append(np.log(dat[0]) if dat[0] > 0 else np.nan)
+                    results.append(dat)
+
+                if verbose > 0:
+                    metrics_widget.update_mapping(loss=np.nanmin([dat[0] for dat in results]))
+                    bar.update(len(results))
+        finally:
+            if executor is not None:
+                executor.shutdown()
+            for block in blocks:
+                block.close()
+                block.unlink()
+            GridSearchOptimizer._getScore.data = None
+
+        if verbose > 0:
+            bar.finish()
+
+        #determine the best parameters by minimizing the error
+        res = min(results, key=lambda dat: np.inf if np.isnan(dat[0]) else dat[0])
+
+        self._best_params = res[2]
+        self._best_mse = res[0]
+
+        return results
+
+    """
+        The evaluations are always distributed by fit, so fit_parallel is the same as fit.
+    """
+    def fit_parallel(self, trainingInput, trainingOutput, validationInput, validationOutput, transientTime, nEvaluations=50, verbose=1, n_jobs=1):
+        return self.fit(trainingInput, trainingOutput, validationInput, validationOutput, transientTime, nEvaluations, verbose, n_jobs)
@@ -5,131 +5,369 @@
 import numpy as np
 import itertools
 import operator
+import copy
 import progressbar
 from .. import helper as hlp
+from .. import backend as B
 
-from multiprocessing import Process, Queue, Manager, Pool #we require Pathos version >=0.2.6. Otherwise we will get an "EOFError: Ran out of input" exception
+from multiprocessing import Pool #we require Pathos version >=0.2.6. Otherwise we will get an "EOFError: Ran out of input" exception
 import multiprocessing
 
 class GridSearchOptimizer:
     """
     Performs basic grid search for ESNs in which the parameter space will be searched in discrete steps.
+
+    If shareReservoirs is set, the grid points which only differ in their spectralRadius, inputScaling, leakingRate (and
+    regressionParameters) share one random reservoir, from which their reservoirs are derived by rescaling. This removes
+    the influence of the random initialization from the comparison and lets their states be propagated together.
     """
 
-    def __init__(self, esnType, parametersDictionary={}, fixedParametersDictionary={}):
+    #hyperparameters which can be changed without creating a new reservoir
+    _scalingParameters = ["spectralRadius", "inputScaling", "leakingRate"]
+
+    def __init__(self, esnType, parametersDictionary={}, fixedParametersDictionary={}, shareReservoirs=False):
         self.esnType = esnType
         self.parametersDictionary = parametersDictionary
         self.fixedParametersDictionary = fixedParametersDictionary
+        self.shareReservoirs = shareReservoirs
+
+    """
+        Splits the grid (or only the points of the grid with the indices rows, see _gridRows) into groups of points, which
+        only differ in their regressionParameters (and, if shareReservoirs is set, in their spectralRadius, inputScaling and
+        leakingRate), so that they can share their reservoir. Every group is a tuple (points, indices): the parameters of its
+        points and the positions of its points in the grid (or in rows).
+    """
+    def _groupParameters(self, rows=None):
+        keys, values = zip(*self.parametersDictionary.items())
+        variableKeys = ["regressionParameters"] + (GridSearchOptimizer._scalingParameters if self.shareReservoirs else [])
+        sharedKeys = [i for i, key in enumerate(keys) if key not in variableKeys]
+
+        if rows is None:
+            rows = self._gridRows()
+
+        groups = {}
+        for index, row in enumerate(rows):
+            params = dict(zip(keys, [v[i] for v, i in zip(values, row)]))
+            group = tuple(row[i] for i in sharedKeys)
+            if group not in groups:
+                groups[group] = ([], [])
+            groups[group][0].append(params)
+            groups[group][1].append(index)
+
+        return list(groups.values())
+
+    """
+        Returns the indices of the values of all points of the grid.
+    """
+    def _gridRows(self):
+        return list(itertools.product(*[range(len(v)) for v in self.parametersDictionary.values()]))
 
     """
-        Processes the async. results of the _get_score methods and indicates the progress to the user.
+        Evaluates the fitted ESN on the validation data. Returns the validation MSE.
     """
     @staticmethod
-    def _processThreadResults(q, numberOfResults, verbose):
-        #no output wanted, so return now
-        if verbose == 0:
-            return
+    def _validate(esn, trainingInput, validationInput, validationOutput):
+        current_state = esn.getState()
 
-        #initialize the progressbar to indicate the progress
-        metrics_widget = progressbar.widgets.FormatCustomText(' Loss:\t%(loss).2E', {'loss': np.nan})
-        bar = progressbar.ProgressBar(max_value=numberOfResults, redirect_stdout=True, widgets=[metrics_widget])
-        bar.widgets = bar.default_widgets() + [metrics_widget]
-        bar.update(0)
+        #evaluate the ESN
+        validationMSEs = []
 
+        #check whether only one validation sequence is ought to be checked or if the esn has to be validated on multiple sequences
+        if len(validationOutput.shape) == len(trainingInput.shape) + 1:
+            for n in range(validationOutput.shape[0]):
+                esn.setState(current_state)
+                outputPrediction = esn.predict(validationInput[n])
+                validationMSEs.append(np.mean((validationOutput[n] - outputPrediction)**2))
+        else:
+             esn.setState(current_state)
+             outputPrediction = esn.predict(validationInput)
+             validationMSEs.append(np.mean((validationOutput - outputPrediction)**2))
 
-        finishedResults = 0
-        validationMSE = np.inf
+        return np.mean(validationMSEs)
+
+    """
+        Checks whether the readouts of several grid points can be solved from shared design matrices: this requires a
+        PredictionESN with the `pinv` or `lsqr` solver and without feedback (so that the validation states do not depend on
+        the output weights).
+    """
+    @staticmethod
+    def _sharesReadouts(esn, trainingInput, trainingOutput):
+        from ..PredictionESN import PredictionESN
 
-        while True:
-            #leave this method only if all results have been fetched
-            if finishedResults == numberOfResults:
-                break
+        return isinstance(esn, PredictionESN) and esn._solver in ["pinv", "lsqr"] and esn._WFeedback is None and \
+               not hlp.isSequenceCollection(trainingInput) and not hlp.isSequenceCollection(trainingOutput)
 
-            #fetch new data
-            newValidationMSE, _, _ = q.get()
-            validationMSE = min(validationMSE, newValidationMSE)
-            finishedResults += 1
+    """
+        Solves the readouts of all penalties for the design matrix X and the target values outputData (shape (time, n_output)).
+        A single eigendecomposition X X^T = V diag(s) V^T serves all of them, as (X X^T + penalty I)^-1 = V diag(1/(s + penalty)) V^T.
+        validationStates contains the design matrices and the target values of the validation sequences.
+        Returns the tuple (validationMSE, trainingAccuracy) for every penalty.
+    """
+    @staticmethod
+    def _scoreReadouts(esn, X, outputData, validationStates, penalties):
+        Y_target = esn.out_inverse_activation(outputData).T
 
-            metrics_widget.update_mapping(loss=validationMSE)
+        if esn._solver == "pinv":
+            WOuts = [np.dot(Y_target, np.linalg.pinv(X))] * len(penalties)
+        else:
+            s, V = np.linalg.eigh(np.dot(X, X.T))
+            YXTV = np.dot(np.dot(Y_target, X.T), V)
+            WOuts = [np.dot(YXTV / (s + penalty[0]), V.T) for penalty in penalties]
 
-            #show progress
-            bar.update(finishedResults)
+        scores = []
+        for WOut in WOuts:
+            trainingAccuracy = np.sqrt(np.mean((esn.out_activation(np.dot(WOut, X).T) - outputData)**2))
+            validationMSE = np.mean([np.mean((output - esn.out_activation(np.dot(WOut, states)).T)**2) for states, output in validationStates])
+            scores.append((validationMSE, trainingAccuracy))
 
-        bar.finish()
+        return scores
 
     """
-        Fits an ESN with one specified set of hyperparameters, evaluates and returns its performance.
+        Returns the validation sequences as a list of (input, output) tuples.
     """
     @staticmethod
-    def _getScore(data):
-        params, fixed_params, trainingInput, trainingOutput, validationInput, validationOutput, transientTime, esnType = data
+    def _validationSequences(trainingInput, validationInput, validationOutput):
+        if len(validationOutput.shape) == len(trainingInput.shape) + 1:
+            return [(validationInput[n], validationOutput[n]) for n in range(validationOutput.shape[0])]
+        return [(validationInput, validationOutput)]
 
-        try:
-            esn = esnType(**params, **fixed_params)
+    """
+        Fits the ESN once and solves the readouts of all points, which only differ in their regressionParameters, from the
+        same design matrix (see _scoreReadouts). Returns the results (validationMSE, trainingAccuracy, params) of the points.
+    """
+    @staticmethod
+    def _scorePenalties(esn, points, trainingInput, trainingOutput, validationInput, validationOutput, transientTime):
+        esn.fit(trainingInput, trainingOutput, transientTime=transientTime)
+        X = esn._X
 
-            trainingAccuracy = esn.fit(trainingInput, trainingOutput, transientTime=transientTime)
+        #the target values of the fit (the transient time might have been determined automatically)
+        outputData = np.asarray(trainingOutput)
+        if len(outputData.shape) <= 2:
+            outputData = outputData.reshape((1, -1, esn.n_output))
+        transientTime = outputData.shape[1] - X.shape[1] // outputData.shape[0]
+        outputData = outputData[:, transientTime:, :].reshape(-1, esn.n_output)
+
+        #the validation states do not depend on the output weights, so they are propagated only once
+        current_state = esn.getState()
+        validationStates = []
+        for inputData, output in GridSearchOptimizer._validationSequences(trainingInput, validationInput, validationOutput):
+            esn.setState(current_state)
+            validationStates.append((esn.propagate(inputData), output))
 
-            current_state = esn._x
+        penalties = [point.get("regressionParameters", esn._regressionParameters) for point in points]
+        scores = GridSearchOptimizer._scoreReadouts(esn, X, outputData, validationStates, penalties)
 
-            #evaluate the ESN
-            validationMSEs = []
+        return [score + (point,) for score, point in zip(scores, points)]
 
-            #check whether only one validation sequence is ought to be checked or if the esn has to be validated on multiple sequences
-            if len(validationOutput.shape) == len(trainingInput.shape) + 1:
-                for n in range(validationOutput.shape[0]):
-                    esn._x = current_state
-                    outputPrediction = esn.predict(validationInput[n])
-                    validationMSEs.append(np.mean((validationOutput[n] - outputPrediction)**2))
+    """
+        Derives the reservoirs of all points from the reservoir of the ESN by rescaling its spectral radius, input scaling and
+        leaking rate, and propagates them together as the columns of one state matrix (see BaseESN.propagateVariants).
+        The readouts of the points are solved from the design matrices of their reservoirs (see _scoreReadouts).
+        Returns the results (validationMSE, trainingAccuracy, params) of the points.
+    """
+    @staticmethod
+    def _scoreVariants(esn, points, trainingInput, trainingOutput, validationInput, validationOutput, transientTime):
+        #find the distinct reservoirs of the points
+        keys = [key for key in GridSearchOptimizer._scalingParameters if key in points[0]]
+        reservoirs = []
+        reservoirOfPoint = []
+        for point in points:
+            for j, reservoir in enumerate(reservoirs):
+                if all([np.array_equal(reservoir[key], point[key]) for key in keys]):
+                    break
             else:
-                 esn._x = current_state
-                 outputPrediction = esn.predict(validationInput)
-                 validationMSEs.append(np.mean((validationOutput - outputPrediction)**2))
+                j = len(reservoirs)
+                reservoirs.append(point)
+            reservoirOfPoint.append(j)
+
+        spectralRadii = [reservoir.get("spectralRadius", esn._spectralRadius) for reservoir in reservoirs]
+        inputScalings = [B.ones(esn.n_input) * reservoir.get("inputScaling", esn._inputScaling) for reservoir in reservoirs]
+        leakingRates = [reservoir.get("leakingRate", esn._leakingRate) for reservoir in reservoirs]
+
+        #propagate the training data like PredictionESN.fit
+        inputData = np.asarray(trainingInput)
+        outputData = np.asarray(trainingOutput)
+        if len(outputData.shape) <= 2:
+            inputData = inputData.reshape((1, -1, esn.n_input))
+            outputData = outputData.reshape((1, -1, esn.n_output))
+
+        x = B.zeros((esn.n_reservoir, len(reservoirs)))
+        X = np.concatenate([esn.propagateVariants(inputData[i], x, spectralRadii, inputScalings, leakingRates, transientTime)
+                            for i in range(len(inputData))], axis=2)
+        outputData = outputData[:, transientTime:, :].reshape(-1, esn.n_output)
+
+        validationStates = []
+        for inputData, output in GridSearchOptimizer._validationSequences(trainingInput, validationInput, validationOutput):
+            validationStates.append((esn.propagateVariants(inputData, x.copy(), spectralRadii, inputScalings, leakingRates), output))
+
+        results = [None] * len(points)
+        for j in range(len(reservoirs)):
+            indices = [i for i in range(len(points)) if reservoirOfPoint[i] == j]
+            penalties = [points[i].get("regressionParameters", esn._regressionParameters) for i in indices]
+            scores = GridSearchOptimizer._scoreReadouts(esn, X[j], outputData, [(states[j], output) for states, output in validationStates], penalties)
+            for i, score in zip(indices, scores):
+                results[i] = score + (points[i],)
 
-            validationMSE = np.mean(validationMSEs)
+        return results
+
+    """
+        Returns a copy of the ESN with the spectralRadius, inputScaling, leakingRate and regressionParameters of the point.
+    """
+    @staticmethod
+    def _deriveVariant(esn, point):
+        esn = copy.deepcopy(esn)
+        if "spectralRadius" in point:
+            esn.setSpectralRadius(point["spectralRadius"])
+        if "inputScaling" in point:
+            esn.setInputScaling(point["inputScaling"])
+        if "leakingRate" in point:
+            esn.setLeakingRate(point["leakingRate"])
+        if "regressionParameters" in point:
+            esn._regressionParameters = point["regressionParameters"]
+        return esn
+
+    """
+        Fits and evaluates the ESNs of one group of grid points (see _groupParameters).
+        Returns the results (validationMSE, trainingAccuracy, params) of the points of the group.
+    """
+    @staticmethod
+    def _scoreGroup(esnType, points, fixed_params, trainingInput, trainingOutput, validationInput, validationOutput, transientTime):
+        esn = esnType(**points[0], **fixed_params)
+        sharesReservoirs = any([not np.array_equal(point.get(key), points[0].get(key)) for point in points for key in GridSearchOptimizer._scalingParameters])
+
+        if GridSearchOptimizer._sharesReadouts(esn, trainingInput, trainingOutput):
+            if sharesReservoirs and isinstance(transientTime, (int, np.integer)):
+                return GridSearchOptimizer._scoreVariants(esn, points, trainingInput, trainingOutput, validationInput, validationOutput, transientTime)
+            elif not sharesReservoirs and len(points) > 1:
+                return GridSearchOptimizer._scorePenalties(esn, points, trainingInput, trainingOutput, validationInput, validationOutput, transientTime)
+
+        #fit the points one after another; the reservoirs are either derived from the first one or created from scratch
+        base = copy.deepcopy(esn) if sharesReservoirs else None
+
+        results = []
+        for index, point in enumerate(points):
+            if index > 0:
+                esn = GridSearchOptimizer._deriveVariant(base, point) if base is not None else esnType(**point, **fixed_params)
 
-            dat = (validationMSE, trainingAccuracy, params)
+            trainingAccuracy = esn.fit(trainingInput, trainingOutput, transientTime=transientTime)
+            validationMSE = GridSearchOptimizer._validate(esn, trainingInput, validationInput, validationOutput)
+
+            results.append((validationMSE, trainingAccuracy, point))
+
+        return results
+
+    """
+        Fits the ESNs of one group of grid points (see _groupParameters), evaluates and returns their performance.
+        The job (index, points) only contains the grid points, the datasets have been passed to the worker by _getScoreInit.
+        Returns the index of the job and the results of its points.
+    """
+    @staticmethod
+    def _getScore(job):
+        index, points = job
+        _, (trainingInput, trainingOutput, validationInput, validationOutput), fixed_params, transientTime, esnType = GridSearchOptimizer._getScore.data
+
+        try:
+            results = GridSearchOptimizer._scoreGroup(esnType, points, fixed_params, trainingInput, trainingOutput,
+                                                      validationInput, validationOutput, transientTime)
         except:
             import sys, traceback
             print("Unexpected error:", sys.exc_info()[0])
             print(traceback.format_exc())
 
-            dat = (np.nan, np.nan, params)
+            results = [(np.nan, np.nan, point) for point in points]
 
+        return index, results
 
-        GridSearchOptimizer._getScore.q.put(dat)
+    """
+        Initializes a worker of fit_parallel: attaches the datasets, which have been placed in shared memory (see
+        _shareDatasets), and stores them together with the settings of all jobs for the _getScore method.
+    """
+    @staticmethod
+    def _getScoreInit(datasets, fixed_params, transientTime, esnType):
+        blocks = []
+        arrays = []
+        for shared, data in datasets:
+            if shared:
+                block, data = hlp.attachSharedArray(data)
+                blocks.append(block)
+            arrays.append(data)
 
-        return dat
+        GridSearchOptimizer._getScore.data = (blocks, arrays, fixed_params, transientTime, esnType)
 
     """
-        Initializes the queue object of the _get_score method.
+        Places the numpy arrays of datasets in shared memory (see helper.createSharedArray), so that they are copied only
+        once instead of being pickled for every job. Other data (e.g. collections of sequences) is passed as it is.
+        Returns the shared memory blocks, which have to be released after the search, and the descriptions of the datasets.
     """
     @staticmethod
-    def _getScoreInit(q):
-        GridSearchOptimizer._getScore.q = q
+    def _shareDatasets(datasets):
+        blocks = []
+        descriptions = []
+        for data in datasets:
+            if isinstance(data, np.ndarray) and not data.dtype.hasobject:
+                block, _, spec = hlp.createSharedArray(data.shape, data.dtype, data)
+                blocks.append(block)
+                descriptions.append((True, spec))
+            else:
+                descriptions.append((False, data))
+
+        return blocks, descriptions
 
     """
         Fits an ESN for each of the wanted hyperparameters and predicts the output.
         The best results parameters will be stores in _best_params.
+        Grid points which only differ in their regressionParameters (or their scalings, see shareReservoirs) are fitted together.
+        The datasets are sent to the workers only once (see _shareDatasets), the jobs are dispatched in chunks of chunkSize
+        groups and their results are streamed back as soon as they are finished: callback is called with every result
+        (validationMSE, trainingAccuracy, params).
     """
-    def fit_parallel(self, trainingInput, trainingOutput, validationInput, validationOutput, transientTime, verbose=1, n_jobs=1):
-        #calculate the length of all permutations of the hyperparameters
-        #create the jobs
-        def enumerate_params():
-            keys, values = zip(*self.parametersDictionary.items())
-            for row in itertools.product(*values):
-                yield dict(zip(keys, row))
-        jobs = []
-        for x in enumerate_params():
-            jobs.append((x, self.fixedParametersDictionary, trainingInput, trainingOutput, validationInput, validationOutput, transientTime, self.esnType))
+    def fit_parallel(self, trainingInput, trainingOutput, validationInput, validationOutput, transientTime, verbose=1, n_jobs=1,
+                     chunkSize=None, callback=None):
+        #create the jobs: one for every group of grid points which share their reservoir
+        groups = self._groupParameters()
+        jobs = [(index, points) for index, (points, _) in enumerate(groups)]
+        length = sum([len(indices) for _, indices in groups])
 
-        queue = Queue()
-        pool = Pool(processes=n_jobs, initializer=GridSearchOptimizer._getScoreInit, initargs=[queue,] )
+        if chunkSize is None:
+            chunkSize = max(1, len(jobs) // (4*n_jobs))
 
-        processProcessResultsThread = Process(target=GridSearchOptimizer._processThreadResults, args=(queue, len(jobs), verbose))
+        if verbose > 0:
+            #initialize the progressbar to indicate the progress
+            metrics_widget = progressbar.widgets.FormatCustomText(' Loss:\t%(loss).2E', {'loss': np.nan})
+            bar = progressbar.ProgressBar(max_value=length, redirect_stdout=True, widgets=[metrics_widget])
+            bar.widgets = bar.default_widgets() + [metrics_widget]
+            bar.update(0)
 
-        processProcessResultsThread.start()
-        results = pool.map(GridSearchOptimizer._getScore, jobs)
-        pool.close()
+        blocks, datasets = GridSearchOptimizer._shareDatasets([trainingInput, trainingOutput, validationInput, validationOutput])
+        pool = Pool(processes=n_jobs, initializer=GridSearchOptimizer._getScoreInit,
+                    initargs=[datasets, self.fixedParametersDictionary, transientTime, self.esnType])
+
+        results = [None] * length
+        finishedResults = 0
+        validationMSE = np.inf
+        try:
+            for index, groupResult in pool.imap_unordered(GridSearchOptimizer._getScore, jobs, chunksize=chunkSize):
+                #restore the order of the grid
+                for position, dat in zip(groups[index][1], groupResult):
+                    results[position] = dat
+                    if callback is not None:
+                        callback(dat)
+
+                finishedResults += len(groupResult)
+                validationMSE = np.nanmin([validationMSE] + [dat[0] for dat in groupResult])
+
+                if verbose > 0:
+                    metrics_widget.update_mapping(loss=validationMSE)
+                    bar.update(finishedResults)
+        finally:
+            pool.close()
+            pool.join()
+            for block in blocks:
+                block.close()
+                block.unlink()
+
+        if verbose > 0:
+            bar.finish()
 
         #determine the best parameters by minimizing the error
         res = min(results, key=operator.itemgetter(0))
@@ -144,14 +382,12 @@ class GridSearchOptimizer:
         """
         Fits an ESN for each of the wanted hyperparameters and predicts the output.
         The best results parameters will be stores in _best_params.
+        Grid points which only differ in their regressionParameters (or their scalings, see shareReservoirs) are fitted together.
         """
 
         #calculate the length of all permutations of the hyperparameters
-        def enumerate_params():
-            keys, values = zip(*self.parametersDictionary.items())
-            for row in itertools.product(*values):
-                yield dict(zip(keys, row))
-        length = sum(1 for x in enumerate_params())
+        groups = self._groupParameters()
+        length = sum([len(indices) for _, indices in groups])
 
         if verbose > 0:
             #initialize the progressbar to indicate the progress
@@ -160,43 +396,27 @@ class GridSearchOptimizer:
             bar.widgets = bar.default_widgets() + [metrics_widget]
 
         #store the results here
-        results = []
-
-        for index, params in enumerate(enumerate_params()):
-            #create and fit the ESN
-            esn = self.esnType(**params, **self.fixedParametersDictionary)
-            trainingAccuracy = esn.fit(trainingInput, trainingOutput, transientTime=transientTime)
-
-            current_state = esn._x
-
-            #evaluate the ESN
-            validationMSEs = []
+        results = [None] * length
+        finishedResults = []
 
-            #check whether only one validation sequence is ought to be checked or if the esn has to be validated on multiple sequences
-            if len(validationOutput.shape) == len(trainingInput.shape) + 1:
-                for n in range(validationOutput.shape[0]):
-                    esn._x = current_state
-                    outputPrediction = esn.predict(validationInput[n])
-                    validationMSEs.append(np.mean((validationOutput[n] - outputPrediction)**2))
-            else:
-                 esn._x = current_state
-                 outputPrediction = esn.predict(validationInput)
-                 validationMSEs.append(np.mean((validationOutput - outputPrediction)**2))
-
-            validationMSE = np.mean(validationMSEs)
+        for points, indices in groups:
+            #create, fit and evaluate the ESNs of this group
+            groupResults = GridSearchOptimizer._scoreGroup(self.esnType, points, self.fixedParametersDictionary, trainingInput, trainingOutput,
+                                                           validationInput, validationOutput, transientTime)
+            for index, dat in zip(indices, groupResults):
+                results[index] = dat
+            finishedResults.extend(groupResults)
 
-            results.append((validationMSE, trainingAccuracy, params))
-            
             if verbose > 0:
-                bar.update(index)
+                bar.update(len(finishedResults) - 1)
 
             #print the currently best result every printfreq step
             if verbose > 1:
-                res = min(results, key=operator.itemgetter(0))
+                res = min(finishedResults, key=operator.itemgetter(0))
                 print("Current best parameters: \t: " + str(res))
 
             if verbose > 0:
-                metrics_widget.update_mapping(loss=min(results, key=operator.itemgetter(0))[0])
+                metrics_widget.update_mapping(loss=min(finishedResults, key=operator.itemgetter(0))[0])
 
         if verbose > 0:
             bar.finish()
@@ -226,6 +446,8 @@ class GridSearchOptimizer:
     @staticmethod
     def plotErrorSurface(esn, N, transientTime, trainInputs, trainTargets, validationInputs, validationTargets, paramDic, gridHeight = None, verbose=1):
         """
+        For PredictionESNs without feedback (and the `pinv` or `lsqr` solver), all grid points are derived from the reservoir
+        of `esn` and propagated together (see BaseESN.propagateVariants); `esn` itself is not changed then.
 
         Args:
 
@@ -279,18 +501,33 @@ class GridSearchOptimizer:
         validationErrorGrid = np.zeros((N, N))
         widthParam1 = (tillParam1 - fromParam1) / N
         widthParam2 = (tillParam2 - fromParam2) / N
-        for i in range(N):
-            p1 = i * widthParam1 + fromParam1
-            setParameter(param1, p1)
-            for j in range(N):
-                p2 = j * widthParam2 + fromParam2
-                setParameter(param2, p2)
-
-                trainErrorGrid[i, j] = esn.fit(trainInputs, trainTargets, transientTime=transientTime)
-                validationErrorGrid[i, j] = hlp.loss(esn.predict(validationInputs), validationTargets)
 
-                if verbose > 0:
-                    bar.update(i*N + j)
+        for parameter in [param1, param2]:
+            if parameter not in GridSearchOptimizer._scalingParameters:
+                raise ValueError("Hyperparameter {0} does not exist. Choose from either spectralRadius, leakingRate, inputScaling".format(parameter))
+
+        #all grid points are derived from the reservoir of the esn, so that they can be propagated together
+        if GridSearchOptimizer._sharesReadouts(esn, trainInputs, trainTargets) and isinstance(transientTime, (int, np.integer)):
+            points = [{param1: i * widthParam1 + fromParam1, param2: j * widthParam2 + fromParam2} for i in range(N) for j in range(N)]
+            results = GridSearchOptimizer._scoreVariants(esn, points, trainInputs, trainTargets, validationInputs, validationTargets, transientTime)
+            for index, (validationMSE, trainingAccuracy, _) in enumerate(results):
+                trainErrorGrid[index // N, index % N] = trainingAccuracy
+                validationErrorGrid[index // N, index % N] = validationMSE
+            if verbose > 0:
+                bar.update(N*N - 1)
+        else:
+            for i in range(N):
+                p1 = i * widthParam1 + fromParam1
+                setParameter(param1, p1)
+                for j in range(N):
+                    p2 = j * widthParam2 + fromParam2
+                    setParameter(param2, p2)
+
+                    trainErrorGrid[i, j] = esn.fit(trainInputs, trainTargets, transientTime=transientTime)
+                    validationErrorGrid[i, j] = hlp.loss(esn.predict(validationInputs), validationTargets)
+
+                    if verbose > 0:
+                        bar.update(i*N + j)
 
         if verbose > 0:
             bar.finish()
@@ -0,0 +1,235 @@
+"""
+    Budget-aware search for ESNs: successive halving and Hyperband on top of the grid of the GridSearchOptimizer.
+"""
+
+import numpy as np
+import progressbar
+
+from multiprocessing import Pool
+
+from .GridSearchOptimizer import GridSearchOptimizer
+
+class SuccessiveHalvingOptimizer(GridSearchOptimizer):
+    """
+    Searches the grid of hyperparameters by successive halving: all configurations are evaluated on a small budget (a
+    truncated training length or fewer training sequences, see fidelity), only the best 1/eta of them are promoted to the
+    next rung with an eta times larger budget, until the remaining configurations are evaluated on the full training data.
+    The validation data is never truncated, so that the errors of all rungs are comparable.
+
+    If hyperband is set, several brackets of successive halving are run, which start with fewer configurations on larger
+    budgets, to hedge against configurations which only perform well on long training data.
+    """
+
+    def __init__(self, esnType, parametersDictionary={}, fixedParametersDictionary={}, shareReservoirs=False, eta=3,
+                 minBudget=1.0/9, fidelity="length", hyperband=False, randomSeed=None):
+        super(SuccessiveHalvingOptimizer, self).__init__(esnType, parametersDictionary, fixedParametersDictionary, shareReservoirs)
+
+        if eta <= 1:
+            raise ValueError("eta has to be larger than 1.")
+        if not 0.0 < minBudget <= 1.0:
+            raise ValueError("minBudget has to be in (0, 1].")
+        if fidelity not in ["length", "sequences"]:
+            raise ValueError("fidelity must be one of the following values: length, sequences")
+
+        self.eta = eta
+        self.minBudget = minBudget
+        self.fidelity = fidelity
+        self.hyperband = hyperband
+        self.randomSeed = randomSeed
+
+    """
+        Returns the brackets of the search as tuples (number of configurations, budget of the first rung, number of rungs).
+    """
+    def _brackets(self, numberOfConfigurations):
+        #number of times the budget can be increased by eta
+        sMax = int(np.floor(np.log(1.0/self.minBudget) / np.log(self.eta) + 1e-9))
+
+        if not self.hyperband:
+            return [(numberOfConfigurations, self.eta**-sMax, sMax + 1)]
+
+        brackets = []
+        for s in range(sMax, -1, -1):
+            n = int(np.ceil((sMax + 1) / (s + 1) * self.eta**s))
+            brackets.append((min(n, numberOfConfigurations), self.eta**-s, s + 1))
+        return brackets
+
+    """
+        Truncates the training data to the budget (a fraction of the training data): either its time axis (fidelity="length")
+        or its number of sequences (fidelity="sequences"). For an integer transientTime, the budget is the fraction of the
+        training steps after it. The time axis of the output is only truncated if outputTimeAxis is
+        set (e.g. for the targets of a PredictionESN, but not for the labels of a ClassificationESN).
+    """
+    @staticmethod
+    def _truncate(trainingInput, trainingOutput, budget, fidelity, transientTime, outputTimeAxis):
+        if budget >= 1.0:
+            return trainingInput, trainingOutput
+
+        if fidelity == "sequences":
+            if isinstance(trainingInput, np.ndarray) and len(trainingInput.shape) <= 2:
+                raise ValueError("The fidelity `sequences` requires multiple training sequences.")
+            n = max(1, int(np.ceil(budget * len(trainingOutput))))
+            return trainingInput[:n], trainingOutput[:n]
+
+        #the time axis is the first one for a single sequence (time, dimension) and the second one for multiple sequences
+        axis = 0 if len(trainingInput.shape) <= 2 else 1
+        length = trainingInput.shape[axis]
+        if isinstance(transientTime, (int, np.integer)):
+            #the budget is the fraction of the steps after the transient time
+            if length <= transientTime:
+                raise ValueError("The training data ({0} steps) is not longer than the transientTime ({1}).".format(length, transientTime))
+            n = transientTime + int(np.ceil(budget * (length - transientTime)))
+        else:
+            #a transient time which is still a string (e.g. of a ClassificationESN) is determined by the ESN on the truncated data
+            n = int(np.ceil(budget * length))
+
+        index = (slice(None),)*axis + (slice(None, n),)
+        if outputTimeAxis:
+            trainingOutput = trainingOutput[index]
+        return trainingInput[index], trainingOutput
+
+    """
+        Fits and evaluates the ESNs of one group of grid points on the budget of the job (index, points, budget, fidelity).
+        The datasets have been passed to the worker by GridSearchOptimizer._getScoreInit.
+        A transient time like "Auto" or "AutoReduce" of a PredictionESN is determined on the full training data (for the
+        first point of the group) before the time axis is truncated.
+        Returns the index of the job and the results of its points. Only configurations which fail numerically are scored
+        as nan (and ranked last), all other errors are raised.
+    """
+    @staticmethod
+    def _getBudgetScore(job):
+        from ..PredictionESN import PredictionESN
+
+        index, points, budget, fidelity = job
+        _, (trainingInput, trainingOutput, validationInput, validationOutput), fixed_params, transientTime, esnType = GridSearchOptimizer._getScore.data
+
+        isPrediction = issubclass(esnType, PredictionESN)
+        if isPrediction and isinstance(transientTime, str) and fidelity == "length" and budget < 1.0:
+            #determine the transient time once on the full training data, as it might not be found on the truncated one
+            esn = esnType(**points[0], **fixed_params)
+            inputData = trainingInput if len(trainingInput.shape) <= 2 else trainingInput[0]
+            outputData = trainingOutput if len(trainingOutput.shape) <= 2 else trainingOutput[0]
+            transientTime = esn._determineTransientTime(inputData, outputData, transientTime, 1e-3, 20)
+
+        trainingInput, trainingOutput = SuccessiveHalvingOptimizer._truncate(trainingInput, trainingOutput, budget, fidelity, transientTime,
+                                                                             isPrediction)
+        try:
+            results = GridSearchOptimizer._scoreGroup(esnType, points, fixed_params, trainingInput, trainingOutput,
+                                                      validationInput, validationOutput, transientTime)
+        except (np.linalg.LinAlgError, FloatingPointError):
+            import sys, traceback
+            print("Numerical error:", sys.exc_info()[0])
+            print(traceback.format_exc())
+
+            results = [(np.nan, np.nan, point) for point in points]
+
+        return index, results
+
+    """
+        Evaluates the configurations (grid rows) on the budget, either in parallel on the pool or in this process.
+        Returns their results in the order of rows.
+    """
+    def _evaluateRung(self, rows, budget, pool):
+        groups = self._groupParameters(rows)
+        jobs = [(index, points, budget, self.fidelity) for index, (points, _) in enumerate(groups)]
+
+        if pool is None:
+            groupResults = map(SuccessiveHalvingOptimizer._getBudgetScore, jobs)
+        else:
+            groupResults = pool.imap_unordered(SuccessiveHalvingOptimizer._getBudgetScore, jobs)
+
+        results = [None] * len(rows)
+        for index, groupResult in groupResults:
+            for position, dat in zip(groups[index][1], groupResult):
+                results[position] = dat
+
+        return results
+
+    """
+        Searches the hyperparameters by successive halving (or Hyperband). The rungs are evaluated in parallel on n_jobs processes.
+        Returns the results (validationMSE, trainingAccuracy, params) of all configurations on the largest budget they have reached,
+        once per configuration even if it has been sampled by several Hyperband brackets (the latest result of its largest budget);
+        the results of all rungs are stored in _history as tuples (bracket, budget, results).
+        The best results parameters (on the full budget) will be stored in _best_params.
+    """
+    def fit(self, trainingInput, trainingOutput, validationInput, validationOutput, transientTime, verbose=1, n_jobs=1):
+        #a private random state, as the ESNs may reseed the global one (randomSeed)
+        random = np.random.RandomState(self.randomSeed)
+
+        allRows = self._gridRows()
+        brackets = self._brackets(len(allRows))
+
+        if verbose > 0:
+            #initialize the progressbar to indicate the progress
+            rungs = sum([numberOfRungs for _, _, numberOfRungs in brackets])
+            metrics_widget = progressbar.widgets.FormatCustomText(' Loss:\t%(loss).2E', {'loss': np.nan})
+            bar = progressbar.ProgressBar(max_value=rungs, redirect_stdout=True, widgets=[metrics_widget])
+            bar.widgets = bar.default_widgets() + [metrics_widget]
+            bar.update(0)
+
+        datasets = [trainingInput, trainingOutput, validationInput, validationOutput]
+        blocks = []
+        pool = None
+        if n_jobs > 1:
+            blocks, descriptions = GridSearchOptimizer._shareDatasets(datasets)
+            pool = Pool(processes=n_jobs, initializer=GridSearchOptimizer._getScoreInit,
+                        initargs=[descriptions, self.fixedParametersDictionary, transientTime, self.esnType])
+        else:
+            GridSearchOptimizer._getScoreInit([(False, data) for data in datasets], self.fixedParametersDictionary, transientTime, self.esnType)
+
+        self._history = []
+        #the largest budget and its result of every configuration (grid row)
+        reached = {}
+        finishedRungs = 0
+        try:
+            for bracket, (numberOfConfigurations, budget, numberOfRungs) in enumerate(brackets):
+                if numberOfConfigurations < len(allRows):
+                    rows = [allRows[i] for i in random.choice(len(allRows), numberOfConfigurations, replace=False)]
+                else:
+                    rows = allRows
+
+                for rung in range(numberOfRungs):
+                    budget = min(1.0, budget) if rung < numberOfRungs - 1 else 1.0
+                    rungResults = self._evaluateRung(rows, budget, pool)
+                    self._history.append((bracket, budget, rungResults))
+
+                    finishedRungs += 1
+                    if verbose > 0:
+                        metrics_widget.update_mapping(loss=np.nanmin([dat[0] for dat in rungResults]))
+                        bar.update(finishedRungs)
+
+                    for row, dat in zip(rows, rungResults):
+                        if row not in reached or reached[row][0] <= budget:
+                            reached[row] = (budget, dat)
+
+                    #promote the best configurations (failed ones are ranked last)
+                    if rung < numberOfRungs - 1:
+                        order = sorted(range(len(rows)), key=lambda i: np.inf if np.isnan(rungResults[i][0]) else rungResults[i][0])
+                        survivors = max(1, len(rows) // self.eta)
+                        rows = [rows[i] for i in order[:survivors]]
+                        budget *= self.eta
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+            for block in blocks:
+                block.close()
+                block.unlink()
+            GridSearchOptimizer._getScore.data = None
+
+        if verbose > 0:
+            bar.finish()
+
+        #determine the best parameters by minimizing the error on the full budget
+        fullResults = [dat for _, budget, rungResults in self._history if budget >= 1.0 for dat in rungResults]
+        res = min(fullResults, key=lambda dat: np.inf if np.isnan(dat[0]) else dat[0])
+
+        self._best_params = res[2]
+        self._best_mse = res[0]
+
+        return [dat for _, dat in reached.values()]
+
+    """
+        The rungs are always evaluated in parallel by fit, so fit_parallel is the same as fit.
+    """
+    def fit_parallel(self, trainingInput, trainingOutput, validationInput, validationOutput, transientTime, verbose=1, n_jobs=1):
+        return self.fit(trainingInput, trainingOutput, validationInput, validationOutput, transientTime, verbose, n_jobs)
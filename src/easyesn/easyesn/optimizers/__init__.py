@@ -1,3 +1,5 @@
 from .GradientOptimizer import GradientOptimizer
 from .GridSearchOptimizer import GridSearchOptimizer 
+from .SuccessiveHalvingOptimizer import SuccessiveHalvingOptimizer
+from .BayesianOptimizer import BayesianOptimizer
 from .Pipeline import Pipeline
\ No newline at end of file
@@ -0,0 +1,150 @@
+"""
+    Functions which are executed by the pool workers (and the executors) of the SpatioTemporalESN. They are kept in their
+    own module, so that they are pickled by reference and the workers keep their state between the jobs.
+"""
+
+import numpy as np
+import copy
+import dill
+import traceback
+
+from easyesn import helper as hp
+
+
+#state of a pool worker: the models it has been initialized with and the setup of the current call
+_worker = {"models": {}, "generation": None, "blocks": [], "arrays": {}}
+
+"""
+    Initializes a pool worker, which is owned by the ESN with the id modelID. The ESN is stored once, later calls
+    only send the attributes which have changed since then (see SpatioTemporalESN._modelDelta).
+"""
+def initWorker(modelID=None, esn=None):
+    if modelID is not None:
+        _worker["models"][modelID] = esn
+
+"""
+    Prepares the worker for the call described by setup, if it has not done so for an earlier chunk of this call:
+    loads the model delta (or the whole model for an external pool), which is shared once per call, attaches the shared arrays (see helper.createSharedArray)
+    and stores the parameters of the call.
+"""
+def _setup(setup):
+    if setup["generation"] == _worker["generation"]:
+        return
+
+    #release the shared arrays of the previous call
+    _worker.pop("patches", None)
+    _worker["arrays"] = {}
+    for block in _worker["blocks"]:
+        block.close()
+    _worker["blocks"] = []
+    _worker["generation"] = None
+
+    block, model = hp.attachSharedArray(setup["model"])
+    model = dill.loads(model.tobytes())
+    block.close()
+
+    if "esn" in model:
+        esn = model["esn"]
+    else:
+        esn = copy.copy(_worker["models"][setup["modelID"]])
+        esn.__dict__.update(model["delta"])
+
+    for key, spec in setup["arrays"].items():
+        block, _worker["arrays"][key] = hp.attachSharedArray(spec)
+        _worker["blocks"].append(block)
+
+    _worker["esn"] = esn
+    _worker["parameters"] = setup["parameters"]
+    _worker["patches"] = esn._extractPatches(_worker["arrays"]["input"])
+    _worker["generation"] = setup["generation"]
+
+"""
+    Fits the pixels with the ids of the task (setup, ids). Their states and (unless averageOutputWeights is set) their
+    output weights are written into the shared arrays. Returns the number of pixels, the sum of their output weights
+    (or the partial sums X X^T and Y X^T of the pooled ridge regression) and the failed ids.
+"""
+def fitPixels(task):
+    setup, ids = task
+    _setup(setup)
+
+    esn = _worker["esn"]
+    arrays = _worker["arrays"]
+    transientTime = _worker["parameters"]["transientTime"]
+    pooled = _worker["parameters"]["pooled"]
+
+    WOutSum = 0.0
+    XXT, YXT = 0.0, 0.0
+    failed = []
+    for id in ids:
+        pixel = (slice(None), slice(None)) + np.unravel_index(id, esn.inputShape)
+        try:
+            if pooled:
+                X, Y_target = esn._propagatePixel(_worker["patches"][pixel], arrays["output"][pixel], arrays["xs"][id], transientTime)
+                XXT = XXT + np.dot(X, X.T)
+                YXT = YXT + np.dot(Y_target, X.T)
+            else:
+                WOut = esn._fitPixel(_worker["patches"][pixel], arrays["output"][pixel], arrays["xs"][id], transientTime)
+                if "WOuts" in arrays:
+                    arrays["WOuts"][id] = WOut
+                WOutSum = WOutSum + WOut
+        except Exception:
+            traceback.print_exc()
+            failed.append(id)
+
+    if pooled:
+        return len(ids), (XXT, YXT), failed
+    return len(ids), WOutSum, failed
+
+"""
+    Predicts the pixels with the ids of the task (setup, ids) for all series and writes their predictions into the shared
+    arrays. Every series starts from the state of the pixel, which is only updated if updateStates is set.
+"""
+def predictPixels(task):
+    setup, ids = task
+    _setup(setup)
+
+    esn = _worker["esn"]
+    arrays = _worker["arrays"]
+    transientTime = _worker["parameters"]["transientTime"]
+    updateStates = _worker["parameters"]["updateStates"]
+
+    for id in ids:
+        WOut = arrays["WOuts"][id] if "WOuts" in arrays else esn._WOut
+        for i in range(len(_worker["patches"])):
+            pixel = (i, slice(None)) + np.unravel_index(id, esn.inputShape)
+            x = arrays["xs"][id] if updateStates else arrays["xs"][id].copy()
+            arrays["prediction"][i, :, id] = esn._predictPixel(_worker["patches"][pixel], WOut, x, transientTime)
+
+    return len(ids),
+
+"""
+    Prepares the copy of the ESN (serialized by SpatioTemporalESN._shardModel) for a shard of rows with the shape
+    shardShape, the states xs and the output weights WOuts of its pixels.
+"""
+def _shardESN(model, shardShape, xs, WOuts):
+    esn = dill.loads(model)
+    esn.inputShape = tuple(shardShape)
+    esn._xs = xs
+    esn._WOuts = WOuts
+    return esn
+
+"""
+    Fits a shard of rows. band is the embedded input of the rows (including the halo, see SpatioTemporalESN._embedTile)
+    and outputData contains the target values of the rows. Returns the states, the output weights of the pixels and the
+    partial result of the shared readout.
+"""
+def fitShard(model, band, outputData, xs, WOuts, transientTime):
+    esn = _shardESN(model, outputData.shape[2:], xs, WOuts)
+    partial = esn._fitTiles(band, outputData, transientTime, patches=esn._extractPatches(band))
+    return esn._xs, esn._WOuts, partial
+
+"""
+    Predicts a shard of rows for all series of band. Returns the states and the prediction with the shape
+    (series, time-transientTime, nShardPixels).
+"""
+def predictShard(model, band, xs, WOuts, transientTime, updateStates):
+    esn = dill.loads(model)
+    patches = esn._extractPatches(band)
+    esn = _shardESN(model, patches.shape[2:2 + esn.n_inputDimensions], xs, WOuts)
+    prediction = esn._predictVectorized(band, transientTime, 0, updateStates, patches=patches)
+    return esn._xs, prediction.reshape(prediction.shape[0], prediction.shape[1], -1)
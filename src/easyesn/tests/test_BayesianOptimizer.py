@@ -0,0 +1,20 @@
+import numpy as np
+
+from easyesn import PredictionESN
+from easyesn.optimizers import BayesianOptimizer
+
+
+def test_moreJobsThanInitialPoints():
+    random = np.random.RandomState(0)
+    inputData = random.rand(400, 1)
+    outputData = np.roll(inputData, 2, axis=0)
+
+    optimizer = BayesianOptimizer(PredictionESN, {"spectralRadius": (0.1, 1.2), "regressionParameters": (1e-6, 1e-1, "log")},
+                                  {"n_input": 1, "n_output": 1, "n_reservoir": 20, "solver": "lsqr", "randomSeed": 1},
+                                  nInitialPoints=4, nCandidates=200, randomSeed=2)
+    results = optimizer.fit(inputData[:300], outputData[:300], inputData[300:], outputData[300:], transientTime=20,
+                            nEvaluations=10, verbose=0, n_jobs=6)
+
+    assert len(results) == 10
+    assert np.all(np.isfinite([dat[0] for dat in results]))
+    assert optimizer._best_mse == np.min([dat[0] for dat in results])
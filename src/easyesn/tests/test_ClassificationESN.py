@@ -0,0 +1,23 @@
+import numpy as np
+import pytest
+
+from easyesn import ClassificationESN
+from easyesn.OneHotEncoder import OneHotEncoder
+
+
+def test_sparseUnknownClassesLikeDense():
+    random = np.random.RandomState(0)
+    inputData = random.rand(30, 20, 1)
+    labels = np.array(["a", "b"] * 12 + ["c"] * 6)
+    encoder = OneHotEncoder(classes=np.array(["a", "b"]), handleUnknown="ignore", sparse=True)
+    outputData = encoder.transform(labels)
+
+    WOuts = []
+    for data in [outputData, outputData.toarray()]:
+        esn = ClassificationESN(1, 20, 2, randomSeed=1, solver="lsqr", regressionParameters=[1e-3])
+        esn.fit(inputData, data, transientTime=2)
+        WOuts.append(esn._W_out)
+
+    assert np.allclose(WOuts[0], WOuts[1])
+    with pytest.raises(ValueError):
+        encoder.inverse_transform(encoder.transformLabels(labels))
@@ -0,0 +1,32 @@
+import threading
+
+import numpy as np
+import pytest
+
+from easyesn import PredictionESN
+
+
+def test_sequencesLikeRagged():
+    random = np.random.RandomState(0)
+    inputData = [random.rand(length, 1) for length in [120, 80, 150]]
+    outputData = [np.roll(sequence, 2, axis=0) for sequence in inputData]
+
+    WOuts = []
+    for data in [(inputData, outputData), (zip(inputData, outputData), None)]:
+        esn = PredictionESN(1, 20, 1, randomSeed=1, solver="lsqr", regressionParameters=[1e-4])
+        esn.fit(*data, transientTime=10)
+        WOuts.append(esn._WOut)
+
+    assert np.allclose(WOuts[0], WOuts[1])
+
+
+def test_sequencesStopLoaderOnError():
+    random = np.random.RandomState(0)
+    sequences = [(random.rand(length, 1), random.rand(length, 1)) for length in [100, 5, 100, 100, 100]]
+    threads = threading.active_count()
+
+    esn = PredictionESN(1, 20, 1, randomSeed=1, solver="lsqr", regressionParameters=[1e-4])
+    with pytest.raises(ValueError):
+        esn.fit(iter(sequences), transientTime=10)
+
+    assert threading.active_count() == threads